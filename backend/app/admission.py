@@ -0,0 +1,213 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from fastapi import HTTPException
+from .metrics import Counter, Histogram, registry
+
+# Priority classes, most urgent first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PREFETCH = "prefetch"
+PRIORITIES = (INTERACTIVE, BATCH, PREFETCH)
+
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+# Only behind a proxy that sets X-Forwarded-For itself can the header be trusted to name the client
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+# Comma separated API keys that get their own fairness bucket; other X-API-Key values are ignored
+ADMISSION_API_KEYS = {k.strip() for k in os.getenv("ADMISSION_API_KEYS", "").split(",") if k.strip()}
+# Longest each class may wait for a generation slot before it is shed with a 503
+DEADLINES = {
+    INTERACTIVE: float(os.getenv("ADMISSION_DEADLINE_INTERACTIVE", "20")),
+    BATCH: float(os.getenv("ADMISSION_DEADLINE_BATCH", "60")),
+    PREFETCH: float(os.getenv("ADMISSION_DEADLINE_PREFETCH", "2")),
+}
+# Assumed model call time until real calls have been measured
+INITIAL_SERVICE_TIME = 2.0
+
+# Who is asking and how urgently; set per request and inherited by tasks it spawns
+request_priority = ContextVar("request_priority", default=INTERACTIVE)
+current_client = ContextVar("current_client", default="anonymous")
+
+admission_wait_seconds = registry.register(Histogram(
+    "recipe_admission_wait_seconds", "Time spent queued for a generation slot", ("priority",)))
+admission_shed_total = registry.register(Counter(
+    "recipe_admission_shed_total", "Generation requests turned away with 503", ("priority", "reason")))
+
+
+class Overloaded(HTTPException):
+    def __init__(self, retry_after):
+        """503 response telling the client when capacity is likely to be free"""
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=503,
+            detail=f"Server busy. Please try again in {self.retry_after} seconds.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency, max_queue=ADMISSION_MAX_QUEUE, deadlines=None):
+        """Bounded, per-client fair queue for generation slots with priority classes"""
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.deadlines = dict(DEADLINES, **(deadlines or {}))
+        self.active = 0
+        self.queued = 0
+        # priority -> client -> waiting futures; clients are served round-robin within a class
+        self.queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self.service_time = INITIAL_SERVICE_TIME
+        self.admitted = 0
+        self.shed = {}
+        self.waits = deque(maxlen=1000)
+
+    def estimate_wait(self, priority):
+        """Expected seconds until a new request of this class gets a slot"""
+        if self.active < self.max_concurrency and not self.queued:
+            return 0.0
+        rank = PRIORITIES.index(priority)
+        ahead = sum(len(waiting) for p in PRIORITIES[:rank + 1] for waiting in self.queues[p].values())
+        return (ahead // self.max_concurrency + 1) * self.service_time
+
+    def _shed(self, priority, reason, retry_after):
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        admission_shed_total.inc(priority, reason)
+        return Overloaded(retry_after)
+
+    def _remove(self, priority, client, future):
+        waiting = self.queues[priority].get(client)
+        if waiting is not None and future in waiting:
+            waiting.remove(future)
+            self.queued -= 1
+            if not waiting:
+                del self.queues[priority][client]
+
+    def _evict_below(self, priority):
+        """Make room by shedding the newest waiter of the busiest client in a less urgent class"""
+        for lower in reversed(PRIORITIES[PRIORITIES.index(priority) + 1:]):
+            clients = self.queues[lower]
+            if clients:
+                client = max(clients, key=lambda c: len(clients[c]))
+                future = clients[client][-1]
+                self._remove(lower, client, future)
+                future.set_exception(self._shed(lower, "evicted", self.service_time))
+                return True
+        return False
+
+    def _dispatch(self):
+        """Hand free slots to the most urgent class, one client at a time"""
+        while self.active < self.max_concurrency and self.queued:
+            priority = next(p for p in PRIORITIES if self.queues[p])
+            clients = self.queues[priority]
+            client, waiting = next(iter(clients.items()))
+            future = waiting.popleft()
+            self.queued -= 1
+            if waiting:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            if future.done():
+                continue
+            self.active += 1
+            future.set_result(True)
+
+    async def _acquire(self, priority, client):
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            return
+        deadline = self.deadlines[priority]
+        expected = self.estimate_wait(priority)
+        if expected > deadline:
+            raise self._shed(priority, "deadline", expected)
+        if self.queued >= self.max_queue and not self._evict_below(priority):
+            raise self._shed(priority, "queue_full", expected)
+
+        future = asyncio.get_running_loop().create_future()
+        self.queues[priority].setdefault(client, deque()).append(future)
+        self.queued += 1
+        try:
+            done, _ = await asyncio.wait({future}, timeout=deadline)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # We were granted a slot just as the caller went away: pass it on
+                self._release()
+            else:
+                self._remove(priority, client, future)
+                future.cancel()
+            raise
+        if not done:
+            self._remove(priority, client, future)
+            future.cancel()
+            raise self._shed(priority, "timeout", self.estimate_wait(priority))
+        future.result()
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority=None, client=None):
+        """Hold one generation slot for the duration of the block"""
+        priority = priority or request_priority.get()
+        client = client or current_client.get()
+        queued = time.perf_counter()
+        await self._acquire(priority, client)
+        started = time.perf_counter()
+        self.admitted += 1
+        self.waits.append(started - queued)
+        admission_wait_seconds.observe(started - queued, priority)
+        try:
+            yield
+        finally:
+            self.service_time = 0.8 * self.service_time + 0.2 * (time.perf_counter() - started)
+            self._release()
+
+    def stats(self):
+        """Queue depth, wait times and shed counts for capacity tuning"""
+        waits = sorted(self.waits)
+        return {
+            "in_flight": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queued": {p: sum(len(w) for w in self.queues[p].values()) for p in PRIORITIES},
+            "clients_waiting": len({c for p in PRIORITIES for c in self.queues[p]}),
+            "max_queue": self.max_queue,
+            "service_time": round(self.service_time, 3),
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "wait_p50": round(waits[len(waits) // 2], 4) if waits else 0.0,
+            "wait_p95": round(waits[int(0.95 * (len(waits) - 1))], 4) if waits else 0.0,
+        }
+
+
+class ClientMiddleware:
+    def __init__(self, app, trust_forwarded_for=TRUST_FORWARDED_FOR, api_keys=ADMISSION_API_KEYS):
+        """ASGI middleware recording who sent the request, for fair queueing
+
+        Clients are told apart by a configured API key, else by the peer address. X-Forwarded-For
+        is only used when trusted, since any caller could rotate it to get a fresh queue.
+        """
+        self.app = app
+        self.trust_forwarded_for = trust_forwarded_for
+        self.api_keys = api_keys
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        key = headers.get(b"x-api-key", b"").decode("latin-1")
+        if key and key in self.api_keys:
+            client = "key:" + key
+        else:
+            client = (scope.get("client") or ("anonymous",))[0]
+            if self.trust_forwarded_for:
+                # The proxy appends the address it saw, so the last entry is the one it vouches for
+                forwarded = headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",")[-1].strip()
+                client = forwarded or client
+        token = current_client.set(client)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client.reset(token)
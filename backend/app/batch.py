@@ -0,0 +1,59 @@
+import asyncio
+import os
+from fastapi import HTTPException
+from .admission import BATCH, request_priority
+
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+
+def validate_jobs(jobs):
+    """Check the shape of a batch request body"""
+    if not isinstance(jobs, list) or not jobs:
+        raise HTTPException(status_code=400, detail="jobs must be a non-empty list")
+    if len(jobs) > BATCH_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_JOBS} jobs per batch")
+    return jobs
+
+
+async def run_job(generator, index, job):
+    """Generate titles (unless a title is given) and the full recipe for one job"""
+    if not isinstance(job, dict) or not job.get('ingredients'):
+        return {"index": index, "error": "ingredients is required", "status": 400}
+    ingredients = job['ingredients']
+    preferences = job.get('preferences')
+    try:
+        result = {"index": index}
+        title = job.get('title')
+        if not title:
+            result["titles"] = await generator.generate_titles_async(ingredients, preferences)
+            title = result["titles"][0]
+        recipe = await generator.generate_full_recipe_async(title, ingredients, preferences)
+        if recipe.get("title") == "Error":
+            return {"index": index, "error": recipe.get("content"), "status": 502}
+        result["recipe"] = recipe
+        return result
+    except HTTPException as e:
+        return {"index": index, "error": e.detail, "status": e.status_code}
+    except Exception as e:
+        return {"index": index, "error": str(e), "status": 500}
+
+
+async def run_batch(generator, jobs, concurrency=BATCH_CONCURRENCY):
+    """Run jobs concurrently and yield each result as soon as it finishes"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(index, job):
+        # Each job runs in its own task, so this only lowers the priority of batch work
+        request_priority.set(BATCH)
+        async with semaphore:
+            return await run_job(generator, index, job)
+
+    tasks = [asyncio.create_task(bounded(i, job)) for i, job in enumerate(jobs)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # Client went away: stop spending quota on the rest
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from .admission import PRIORITIES, Overloaded, request_priority
+from .state import state
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))  # seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Optional on-disk tier, disabled unless a path is given
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB")
+# With shared state, how long a worker may hold a generation before others stop waiting for it
+SHARED_CACHE_LEASE = float(os.getenv("SHARED_CACHE_LEASE", "30"))
+SHARED_CACHE_POLL = 0.05
+
+
+def canonical_ingredients(ingredients):
+    """Lowercase, trim, de-duplicate and sort a comma separated ingredient list"""
+    if isinstance(ingredients, str):
+        ingredients = ingredients.split(',')
+    return tuple(sorted({i.strip().lower() for i in ingredients if i and i.strip()}))
+
+
+def make_key(kind, ingredients, preferences=None, title=None, **extra):
+    """Stable cache key for a generation request; `extra` parts are hashed exactly as given"""
+    parts = {
+        "kind": kind,
+        "ingredients": canonical_ingredients(ingredients),
+        "preferences": " ".join((preferences or "").lower().split()),
+        "title": " ".join((title or "").lower().split()),
+        **extra,
+    }
+    raw = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+    return f"{kind}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+class LRUCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 ttl=RESPONSE_CACHE_TTL):
+        """In-process LRU with TTL and entry/byte limits"""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (expires, size, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    def __init__(self, path, ttl=RESPONSE_CACHE_TTL):
+        """On-disk cache tier shared across restarts"""
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl),
+            )
+            self._conn.commit()
+
+
+class StateCache:
+    def __init__(self, state, namespace="responses", ttl=RESPONSE_CACHE_TTL, lease=SHARED_CACHE_LEASE):
+        """Cache tier in a shared state backend, with leases so only one worker generates a key"""
+        self.state = state
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lease = lease
+
+    def get(self, key):
+        return self.state.get(self.namespace, key)
+
+    def set(self, key, value):
+        self.state.set(self.namespace, key, value, self.ttl)
+
+    def claim(self, key):
+        """Take the lease to generate `key`; False if another worker holds it"""
+        return self.state.add(self.namespace + ":lease", key, os.getpid(), self.lease)
+
+    def release(self, key):
+        self.state.delete(self.namespace + ":lease", key)
+
+    def held(self, key):
+        return self.state.get(self.namespace + ":lease", key) is not None
+
+
+class ResponseCache:
+    def __init__(self, memory=None, disk=None):
+        """Two-tier response cache with single-flight request collapsing"""
+        self.memory = memory or LRUCache()
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # key -> (future, priority of the request computing it)
+        self._pending = {}
+
+    def peek(self, key):
+        """Cached value from either tier, without counting a hit or miss"""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def get(self, key):
+        value = self.peek(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def get_or_compute(self, key, compute):
+        """Return the cached value or await `compute()` once for all concurrent callers"""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        priority = request_priority.get()
+        if key in self._pending:
+            pending, owner = self._pending[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The owning call was cancelled (e.g. a dropped prefetch), not us: compute it ourselves
+                if not pending.cancelled():
+                    raise
+                return await self.get_or_compute(key, compute)
+            except Overloaded:
+                # A less urgent owner was shed; that says nothing about whether we would be
+                if PRIORITIES.index(priority) >= PRIORITIES.index(owner):
+                    raise
+                return await self.get_or_compute(key, compute)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = (future, priority)
+        claimed = False
+        try:
+            if hasattr(self.disk, "claim"):
+                # Another worker process may already be generating this key: wait for its result
+                claimed = self.disk.claim(key)
+                if not claimed:
+                    value = await self._wait_for_peer(key)
+            if value is None:
+                value = await compute()
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Avoid "exception never retrieved" when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+            if claimed:
+                self.disk.release(key)
+
+    async def _wait_for_peer(self, key):
+        """Poll the shared tier until the lease holder stores a value or gives up"""
+        deadline = time.monotonic() + self.disk.lease
+        delay = SHARED_CACHE_POLL
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            value = self.disk.get(key)
+            if value is not None:
+                self.coalesced += 1
+                self.memory.set(key, value)
+                return value
+            if not self.disk.held(key):
+                return None
+            delay = min(delay * 2, 1.0)
+        return None
+
+    def stats(self):
+        """Hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self.memory),
+            "bytes": self.memory.size,
+        }
+
+
+def build_response_cache():
+    """Response cache configured from the environment"""
+    if state.shared:
+        disk = StateCache(state)
+    else:
+        disk = SQLiteCache(RESPONSE_CACHE_DB) if RESPONSE_CACHE_DB else None
+    return ResponseCache(LRUCache(), disk)
+
+
+response_cache = build_response_cache()
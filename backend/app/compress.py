@@ -0,0 +1,112 @@
+import base64
+import json
+import os
+import zlib
+from .index import recipe_terms
+from .parser import parse_recipe
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PANTRY_COMPRESSION = os.getenv("PANTRY_COMPRESSION", "true").lower() == "true"
+# 'zstd' needs the optional zstandard package; 'auto' uses it when installed
+RECIPE_CODEC = os.getenv("RECIPE_CODEC", "auto")
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 19
+
+# Preset dictionary built from the generated recipe format and the saved-record JSON.
+# zlib favours matches near the end, so the most common strings come last.
+# Stored bodies name the dictionary version; never edit v1 in place, add a new one.
+RECIPE_ZDICT_V1 = (
+    '{"saved_date":"2024-01-01 12:00:00","title":"","content":"","recipe":{"title":"","description":"",'
+    '"prep_minutes":null,"cook_minutes":null,"servings":null,"ingredients":[],"steps":[],"tips":[]}}'
+    '{"name":"","quantity":null,"unit":null,"group":null},'
+    '{"name":"","quantity":1.0,"unit":"tbsp","group":null},{"name":"","quantity":1.0,"unit":"tsp","group":null},'
+    '{"name":"","quantity":1.0,"unit":"cup","group":null},{"name":"","quantity":100.0,"unit":"g","group":null},'
+    'salt and pepper, olive oil, butter, garlic, onion, lemon juice, to taste, finely chopped, '
+    'minced, diced, sliced, grated, freshly ground black pepper, for garnish, '
+    'Preheat the oven to 200°C (400°F). Heat the oil in a large pan over medium heat. '
+    'Bring to a boil, then reduce the heat and simmer for 10 minutes, stirring occasionally. '
+    'Season with salt and pepper to taste. Serve immediately. until golden brown. '
+    'Let it rest for 5 minutes before serving. Add the garlic and cook for 1 minute until fragrant. '
+    '\n[TITLE]\n\nDESCRIPTION:\nPREPARATION TIME: 15 minutes\nCOOKING TIME: 30 minutes\nSERVINGS: 4\n'
+    'INGREDIENTS:\n- 1 tbsp \n- 1 tsp \n- 2 cups \n- 100 g \nINSTRUCTIONS:\n1. \n2. \n3. \n4. \n5. \n'
+    'TIPS:\n- \n- \n'
+).encode()
+ZDICTS = {"1": RECIPE_ZDICT_V1}
+CURRENT_ZDICT = "1"
+
+_zstd_dicts = {}
+
+
+def _zstd_dict(version):
+    if version not in _zstd_dicts:
+        _zstd_dicts[version] = zstandard.ZstdCompressionDict(ZDICTS[version], dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    return _zstd_dicts[version]
+
+
+def _codec():
+    if RECIPE_CODEC == "zstd" or (RECIPE_CODEC == "auto" and zstandard is not None):
+        if zstandard is None:
+            raise RuntimeError("RECIPE_CODEC=zstd needs the zstandard package")
+        return "zs"
+    return "z"
+
+
+def compress(data):
+    """Compress bytes with the recipe dictionary; the result names its codec and dictionary"""
+    codec = _codec()
+    if codec == "zs":
+        body = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_zstd_dict(CURRENT_ZDICT)).compress(data)
+    else:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -15, zdict=ZDICTS[CURRENT_ZDICT])
+        body = compressor.compress(data) + compressor.flush()
+    return f"{codec}{CURRENT_ZDICT}:" + base64.b64encode(body).decode('ascii')
+
+
+def decompress(blob):
+    header, _, body = blob.partition(':')
+    raw = base64.b64decode(body)
+    if header.startswith("zs"):
+        if zstandard is None:
+            raise RuntimeError("This recipe was stored with zstd; install the zstandard package")
+        return zstandard.ZstdDecompressor(dict_data=_zstd_dict(header[2:])).decompress(raw)
+    decompressor = zlib.decompressobj(-15, zdict=ZDICTS[header[1:]])
+    return decompressor.decompress(raw) + decompressor.flush()
+
+
+def is_packed(record):
+    return 'body' in record
+
+
+def pack_recipe(recipe):
+    """Saved-recipe record with everything but the title, date and index terms compressed
+
+    The parsed 'recipe' dict is left out when it can be rebuilt from 'content'.
+    """
+    if not PANTRY_COMPRESSION or is_packed(recipe):
+        return recipe
+    rest = {k: v for k, v in recipe.items() if k not in ('title', 'saved_date')}
+    content = rest.get('content')
+    parsed = parse_recipe(content, recipe.get('title')).to_dict() if content else None
+    if parsed is not None and rest.get('recipe') == parsed:
+        del rest['recipe']
+    terms = recipe_terms({**recipe, 'recipe': recipe.get('recipe') or parsed})
+    packed = {'title': recipe.get('title'), 'terms': sorted(terms)}
+    if 'saved_date' in recipe:
+        packed['saved_date'] = recipe['saved_date']
+    packed['body'] = compress(json.dumps(rest, separators=(',', ':'), ensure_ascii=False).encode())
+    return packed
+
+
+def unpack_recipe(record):
+    """Full saved recipe from a packed record; unpacked records pass through"""
+    if not is_packed(record):
+        return record
+    recipe = {k: v for k, v in record.items() if k not in ('body', 'terms')}
+    recipe.update(json.loads(decompress(record['body'])))
+    if 'recipe' not in recipe and recipe.get('content'):
+        recipe['recipe'] = parse_recipe(recipe['content'], recipe.get('title')).to_dict()
+    return recipe
@@ -0,0 +1,113 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .admission import AdmissionController
+from .metrics import observe_phase, record_usage
+
+# Per-process cap on model calls in flight at once
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "32"))
+
+
+class GenerationEngine:
+    def __init__(self, max_concurrency=MAX_CONCURRENT_GENERATIONS, admission=None):
+        """Run model calls without blocking the event loop"""
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        # Slots are handed out by priority class and fairly between clients; overflow is shed with 503
+        self.admission = admission or AdmissionController(max_concurrency)
+        self._executor = None
+
+    def _get_executor(self):
+        """Create the fallback thread pool on first use"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix="generation",
+            )
+        return self._executor
+
+    async def generate(self, model, prompt, **kwargs):
+        """Generate content for a prompt and return the response text"""
+        queued = time.perf_counter()
+        async with self.admission.slot():
+            started = time.perf_counter()
+            observe_phase("queue_wait", started - queued)
+            self.in_flight += 1
+            try:
+                if hasattr(model, "generate_content_async"):
+                    response = await model.generate_content_async(prompt, **kwargs)
+                else:
+                    loop = asyncio.get_running_loop()
+                    call = functools.partial(model.generate_content, prompt, **kwargs)
+                    response = await loop.run_in_executor(self._get_executor(), call)
+            finally:
+                self.in_flight -= 1
+                observe_phase("gemini", time.perf_counter() - started)
+        record_usage(response)
+        return response.text
+
+    async def stream(self, model, prompt, **kwargs):
+        """Yield response text chunks as the model produces them"""
+        queued = time.perf_counter()
+        async with self.admission.slot():
+            started = time.perf_counter()
+            observe_phase("queue_wait", started - queued)
+            self.in_flight += 1
+            first = True
+            try:
+                if hasattr(model, "generate_content_async"):
+                    response = await model.generate_content_async(prompt, stream=True, **kwargs)
+                    chunks = response
+                else:
+                    response = None
+                    chunks = self._stream_in_executor(model, prompt, **kwargs)
+                async for chunk in chunks:
+                    text = chunk.text if response is not None else chunk
+                    if not text:
+                        continue
+                    if first:
+                        observe_phase("gemini_first_chunk", time.perf_counter() - started)
+                        first = False
+                    yield text
+                if response is not None:
+                    record_usage(response)
+            finally:
+                self.in_flight -= 1
+                observe_phase("gemini", time.perf_counter() - started)
+
+    async def _stream_in_executor(self, model, prompt, **kwargs):
+        """Drive a blocking streaming call from the thread pool"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        def produce():
+            try:
+                for chunk in model.generate_content(prompt, stream=True, **kwargs):
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        loop.run_in_executor(self._get_executor(), produce)
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if item:
+                yield item
+
+    def stats(self):
+        """Current concurrency usage"""
+        return {"in_flight": self.in_flight, "max_concurrency": self.max_concurrency,
+                "admission": self.admission.stats()}
+
+    def shutdown(self):
+        """Release the fallback thread pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,132 @@
+import re
+from bisect import bisect_left, bisect_right
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {'a', 'an', 'and', 'the', 'of', 'with', 'for', 'in', 'on', 'to', 'or', 'fresh', 'chopped'}
+
+
+def tokenize(text):
+    """Lowercase word tokens with simple plural folding"""
+    tokens = set()
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        if len(token) > 3 and token.endswith('es') and token[-3] in 'osx':
+            token = token[:-2]
+        elif len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.add(token)
+    return tokens
+
+
+def recipe_terms(recipe):
+    """Index terms for a saved recipe: title words plus ingredient names"""
+    if 'terms' in recipe:
+        # Compressed records carry their terms precomputed
+        return set(recipe['terms'])
+    terms = tokenize(recipe.get('title', ''))
+    parsed = recipe.get('recipe') or {}
+    for ingredient in parsed.get('ingredients', []):
+        terms |= tokenize(ingredient.get('name', ''))
+    return terms
+
+
+class RecipeIndex:
+    def __init__(self):
+        """Inverted index from title/ingredient tokens to recipe titles"""
+        self.postings = {}
+        self.terms = {}
+
+    def add(self, recipe):
+        title = recipe['title']
+        self.remove(title)
+        terms = recipe_terms(recipe)
+        self.terms[title] = terms
+        for term in terms:
+            self.postings.setdefault(term, set()).add(title)
+
+    def remove(self, title):
+        for term in self.terms.pop(title, ()):
+            titles = self.postings.get(term)
+            if titles is not None:
+                titles.discard(title)
+                if not titles:
+                    del self.postings[term]
+
+    def clear(self):
+        self.postings.clear()
+        self.terms.clear()
+
+    def search(self, query):
+        """Titles containing every query term"""
+        terms = tokenize(query)
+        if not terms:
+            return set()
+        sets = sorted((self.postings.get(term, set()) for term in terms), key=len)
+        result = set(sets[0])
+        for titles in sets[1:]:
+            result &= titles
+            if not result:
+                break
+        return result
+
+
+class InsertionOrder:
+    def __init__(self):
+        """Titles in save order with O(log n) cursor lookups"""
+        self.next_seq = 1
+        self.seqs = []
+        self.titles = {}
+        self.by_title = {}
+
+    def add(self, title, seq=None):
+        """Append a title, numbered by the caller (a store row id) or by the next local number"""
+        self.remove(title)
+        if seq is None:
+            seq = self.next_seq
+        self.next_seq = max(self.next_seq, seq + 1)
+        if not self.seqs or seq > self.seqs[-1]:
+            self.seqs.append(seq)
+        else:
+            # Another worker's row arriving late, or our own row seen again: keep the list sorted and unique
+            i = bisect_left(self.seqs, seq)
+            if i == len(self.seqs) or self.seqs[i] != seq:
+                self.seqs.insert(i, seq)
+        self.titles[seq] = title
+        self.by_title[title] = seq
+
+    def title_at(self, seq):
+        return self.titles.get(seq)
+
+    def remove(self, title):
+        seq = self.by_title.pop(title, None)
+        if seq is not None:
+            del self.titles[seq]
+            # Removed seqs stay in the list until they outnumber live ones
+            if len(self.seqs) > 2 * len(self.titles) + 64:
+                self.seqs = [s for s in self.seqs if s in self.titles]
+
+    def in_order(self):
+        """Every title, oldest save first"""
+        return [self.titles[seq] for seq in self.seqs if seq in self.titles]
+
+    def clear(self):
+        self.next_seq = 1
+        self.seqs.clear()
+        self.titles.clear()
+        self.by_title.clear()
+
+    def page(self, cursor=0, limit=100):
+        """Up to `limit` titles saved after `cursor`, and the cursor for the next page"""
+        titles = []
+        last = cursor
+        for i in range(bisect_right(self.seqs, cursor), len(self.seqs)):
+            seq = self.seqs[i]
+            title = self.titles.get(seq)
+            if title is None:
+                continue
+            if len(titles) == limit:
+                return titles, last
+            titles.append(title)
+            last = seq
+        return titles, None
@@ -0,0 +1,171 @@
+import time
+import orjson
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.responses import JSONResponse
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Route being served, so phase timings deep in the generator can be labelled per endpoint
+current_endpoint = ContextVar("current_endpoint", default="none")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> per-bucket counts (last slot is +Inf), then sum and count
+        self._series = {}
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, read, kind="gauge"):
+        """Value read from `read()` at scrape time"""
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {self.read()}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.register(Histogram(
+    "recipe_request_seconds", "End-to-end request latency", ("endpoint", "method", "status")))
+phase_seconds = registry.register(Histogram(
+    "recipe_phase_seconds", "Time spent per request phase", ("endpoint", "phase")))
+tokens_total = registry.register(Counter(
+    "recipe_gemini_tokens_total", "Prompt and response tokens reported by Gemini", ("endpoint", "kind")))
+fallback_titles_total = registry.register(Counter(
+    "recipe_fallback_titles_total", "Title requests answered with fallback titles", ("endpoint",)))
+
+
+def observe_phase(phase, seconds):
+    phase_seconds.observe(seconds, current_endpoint.get(), phase)
+
+
+@contextmanager
+def timed_phase(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - start)
+
+
+def record_usage(response):
+    """Count tokens from a Gemini response's usage metadata, when present"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    endpoint = current_endpoint.get()
+    prompt = getattr(usage, "prompt_token_count", 0) or 0
+    completion = getattr(usage, "candidates_token_count", 0) or 0
+    if prompt:
+        tokens_total.inc(endpoint, "prompt", amount=prompt)
+    if completion:
+        tokens_total.inc(endpoint, "response", amount=completion)
+
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content):
+        with timed_phase("serialization"):
+            return super().render(content)
+
+
+class TimedORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson, for the larger listing payloads"""
+    def render(self, content):
+        with timed_phase("serialization"):
+            return orjson.dumps(content)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        """ASGI middleware recording per-endpoint latency"""
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        token = current_endpoint.set(scope["path"])
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_endpoint.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            request_seconds.observe(time.perf_counter() - start, endpoint, scope["method"], status["code"])
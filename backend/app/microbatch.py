@@ -0,0 +1,115 @@
+import asyncio
+import os
+from . import prompts
+from .admission import Overloaded
+from .metrics import Counter, registry, timed_phase
+from .parser import parse_batch_titles
+from .ratelimit import RateLimitExceeded
+
+TITLE_BATCH_ENABLED = os.getenv("TITLE_BATCH_ENABLED", "false").lower() == "true"
+# Hold title requests this long, or until this many are waiting, before sending one combined prompt
+TITLE_BATCH_WINDOW_MS = float(os.getenv("TITLE_BATCH_WINDOW_MS", "50"))
+TITLE_BATCH_MAX_ITEMS = int(os.getenv("TITLE_BATCH_MAX_ITEMS", "8"))
+# A set with fewer parsed titles than this is regenerated on its own
+TITLE_BATCH_MIN_TITLES = 3
+
+title_batches_total = registry.register(Counter(
+    "recipe_title_batches_total", "Combined title prompts sent, by outcome", ("outcome",)))
+
+
+class TitleBatcher:
+    def __init__(self, generator, window_ms=TITLE_BATCH_WINDOW_MS, max_items=TITLE_BATCH_MAX_ITEMS):
+        """Collect concurrent title requests and answer them with one model call"""
+        self.generator = generator
+        self.window = window_ms / 1000.0
+        self.max_items = max_items
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self.requests = 0
+        self.batches = 0
+        self.fallbacks = 0
+
+    async def submit(self, ingredients, preferences=None):
+        """Titles for one request, generated together with whatever else arrives in the window"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((ingredients, preferences, future))
+        self.requests += 1
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        batch = [item for item in batch if not item[2].done()]
+        if len(batch) <= 1:
+            # Nothing to combine with: a lone request goes out as usual
+            for item in batch:
+                await self._single(*item)
+            return
+
+        self.batches += 1
+        prompt = prompts.batch_titles_prompt([(ingredients, preferences) for ingredients, preferences, _ in batch])
+        try:
+            text = await self.generator.limiter.call(
+                lambda: self.generator.engine.generate(self.generator.model, prompt.text,
+                                                       generation_config=prompt.config))
+        except (RateLimitExceeded, Overloaded) as e:
+            title_batches_total.inc("rate_limited" if isinstance(e, RateLimitExceeded) else "shed")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except Exception as e:
+            print(f"Error generating batched titles: {e}")
+            title_batches_total.inc("error")
+            parsed = {}
+        else:
+            with timed_phase("parse"):
+                parsed = parse_batch_titles(text)
+            title_batches_total.inc("ok")
+
+        retry = []
+        for number, (ingredients, preferences, future) in enumerate(batch, 1):
+            titles = parsed.get(number, [])
+            if future.done():
+                continue
+            if len(titles) >= TITLE_BATCH_MIN_TITLES:
+                future.set_result(self.generator._complete_titles(titles, ingredients))
+            else:
+                retry.append((ingredients, preferences, future))
+        if retry:
+            # Whatever the combined answer missed goes out as ordinary per-request calls
+            self.fallbacks += len(retry)
+            await asyncio.gather(*(self._single(*item) for item in retry))
+
+    async def _single(self, ingredients, preferences, future):
+        try:
+            titles = await self.generator.limiter.call(
+                lambda: self.generator._generate_titles_once(ingredients, preferences))
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(titles)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "fallbacks": self.fallbacks,
+            "pending": len(self._pending),
+            "window_ms": self.window * 1000,
+            "max_items": self.max_items,
+        }
@@ -1,119 +1,340 @@
-import google.generativeai as genai
 import json
+import os
+import sys
+import threading
 from datetime import datetime
+from . import prompts, refine
+from .admission import Overloaded
+from .cache import make_key, response_cache
+from .compress import PANTRY_COMPRESSION, is_packed, pack_recipe, unpack_recipe
+from .engine import GenerationEngine
+from .index import InsertionOrder, RecipeIndex
+from .microbatch import TITLE_BATCH_ENABLED, TitleBatcher
+from .metrics import current_endpoint, fallback_titles_total, timed_phase
+from .parser import parse_recipe, parse_titles
+from .providers import build_provider
+from .ratelimit import RateLimitExceeded, rate_limiter
+from .semantic import semantic_cache
+from .state import state
 
 class RecipeGenerator:
-    def __init__(self):
-        """Initialize the recipe generator with Gemini"""
+    def __init__(self, engine=None, limiter=None, cache=None, provider=None, semantic=None, batcher=None):
+        """Set up the recipe generator; the model backend loads on first use"""
+        self.provider = provider or build_provider()
+        self.engine = engine or GenerationEngine()
+        self.limiter = limiter or rate_limiter
+        self.cache = cache or response_cache
+        self.semantic = semantic if semantic is not None else semantic_cache
+        self.batcher = batcher or (TitleBatcher(self) if TITLE_BATCH_ENABLED else None)
+
+    @property
+    def model(self):
+        return self.provider
+
+    async def warm_up(self):
+        """Load the model backend ahead of the first generation request"""
         try:
-            print("Initializing Gemini model...")
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            print("Model initialized successfully!")
+            await self.provider.load_async()
+            return True
         except Exception as e:
             print(f"Error in initialization: {str(e)}")
-            self.model = None
+            return False
 
-    def generate_titles(self, ingredients, preferences=None):
-        """Generate 5 possible recipe titles using Gemini"""
-        try:
-            prompt = f"""
-            Create 5 COMPLETELY DIFFERENT and unique recipe titles using these ingredients: {ingredients}
-            {f'Considering these preferences: {preferences}' if preferences else ''}
-            Rules for titles:
-            - Each must be VERY different from the others
-            - Each must use different cooking methods
-            - Each should have a different cuisine influence
-            - Make them creative and appetizing
-            - Number them 1-5
-            - Each title should be 3-7 words long
-            """
-
-            response = self.model.generate_content(prompt)
-            titles = response.text.strip().split('\n')
-            titles = [t.strip().split('.', 1)[-1].strip() for t in titles if t.strip() and any(c.isdigit() for c in t)]
-            titles = [t.strip('.- 1234567890') for t in titles]
-            titles = list(dict.fromkeys(titles))
-
-            while len(titles) < 5:
-                style = ['Grilled', 'Baked', 'Sautéed', 'Roasted', 'Stir-Fried'][len(titles)]
-                main_ingredient = ingredients.split(',')[0].strip().capitalize()
-                titles.append(f"{style} {main_ingredient} Special")
-
-            return titles[:5]
+    def _titles_prompt(self, ingredients, preferences=None):
+        return prompts.titles_prompt(ingredients, preferences)
+
+    def _parse_titles(self, text, ingredients):
+        with timed_phase("parse"):
+            titles = parse_titles(text)
+        return self._complete_titles(titles, ingredients)
+
+    def _complete_titles(self, titles, ingredients):
+        """Exactly 5 titles, padding a short answer with generic ones"""
+        titles = list(titles)
+        while len(titles) < 5:
+            style = ['Grilled', 'Baked', 'Sautéed', 'Roasted', 'Stir-Fried'][len(titles)]
+            main_ingredient = ingredients.split(',')[0].strip().capitalize()
+            titles.append(f"{style} {main_ingredient} Special")
+
+        return titles[:5]
+
+    def fallback_title(self, ingredients):
+        """Placeholder title returned when generation fails"""
+        return f"Quick {ingredients.split(',')[0].capitalize()} Dish"
+
+    def _fallback_titles(self, ingredients):
+        fallback_titles_total.inc(current_endpoint.get())
+        return [self.fallback_title(ingredients)] * 5
+
+    def _recipe_result(self, title, text):
+        with timed_phase("parse"):
+            recipe = parse_recipe(text, title).to_dict()
+        return {"title": title, "content": text, "recipe": recipe}
+
+    async def _similar_or_generate(self, kind, ingredients, preferences, run, title=None):
+        value = self.semantic.get(kind, ingredients, preferences, title)
+        if value is None:
+            value = await run()
+            self.semantic.set(kind, ingredients, preferences, value, title)
+        return value
+
+    def _recipe_prompt(self, title, ingredients, preferences=None):
+        return prompts.recipe_prompt(title, ingredients, preferences)
 
+    async def _generate_titles_once(self, ingredients, preferences=None):
+        prompt = self._titles_prompt(ingredients, preferences)
+        text = await self.engine.generate(self.model, prompt.text, generation_config=prompt.config)
+        return self._parse_titles(text, ingredients)
+
+    async def generate_titles_async(self, ingredients, preferences=None):
+        """Generate 5 possible recipe titles without blocking the event loop"""
+        def run():
+            if self.batcher is not None:
+                return self.batcher.submit(ingredients, preferences)
+            return self.limiter.call(lambda: self._generate_titles_once(ingredients, preferences))
+
+        key = make_key("titles", ingredients, preferences)
+        try:
+            return await self.cache.get_or_compute(
+                key, lambda: self._similar_or_generate("titles", ingredients, preferences, run))
+        except (RateLimitExceeded, Overloaded):
+            raise
         except Exception as e:
             print(f"Error generating titles: {e}")
-            return [f"Quick {ingredients.split(',')[0].capitalize()} Dish"] * 5
+            return self._fallback_titles(ingredients)
 
-    def generate_full_recipe(self, title, ingredients, preferences=None):
-        """Generate full recipe for selected title"""
+    async def generate_full_recipe_async(self, title, ingredients, preferences=None):
+        """Generate full recipe for selected title without blocking the event loop"""
+        async def generate():
+            prompt = self._recipe_prompt(title, ingredients, preferences)
+            text = await self.engine.generate(self.model, prompt.text, generation_config=prompt.config)
+            return self._recipe_result(title, text)
+
+        key = make_key("recipe", ingredients, preferences, title)
         try:
-            prompt = f"""
-            Create a detailed recipe for: {title}
-            Using these ingredients: {ingredients}
-            {f'Preferences: {preferences}' if preferences else ''}
-            Follow this EXACT format:
-            [TITLE]
-            {title}
-            DESCRIPTION:
-            [Write a brief 2-3 sentence description of the dish]
-            PREPARATION TIME: [X] minutes
-            COOKING TIME: [X] minutes
-            SERVINGS: [X]
-            INGREDIENTS:
-            - [List each ingredient with exact measurements]
-            INSTRUCTIONS:
-            1. [First step]
-            2. [Second step]
-            [Continue with all steps]
-            TIPS:
-            - [Add 2-3 cooking tips specific to this recipe]
-            """
-
-            response = self.model.generate_content(prompt)
-            return {"title": title, "content": response.text}
+            return await self.cache.get_or_compute(
+                key, lambda: self._similar_or_generate(
+                    "recipe", ingredients, preferences, lambda: self.limiter.call(generate), title))
+        except (RateLimitExceeded, Overloaded):
+            raise
+        except Exception as e:
+            return {"title": "Error", "content": str(e)}
+
+    async def stream_full_recipe(self, title, ingredients, preferences=None):
+        """Yield the recipe text as it is generated, caching the assembled result"""
+        key = make_key("recipe", ingredients, preferences, title)
+        cached = self.cache.get(key) or self.semantic.get("recipe", ingredients, preferences, title)
+        if cached is not None:
+            yield cached["content"]
+            return
+
+        await self.limiter.acquire()
+        chunks = []
+        prompt = self._recipe_prompt(title, ingredients, preferences)
+        async for text in self.engine.stream(self.model, prompt.text, generation_config=prompt.config):
+            chunks.append(text)
+            yield text
+        result = self._recipe_result(title, "".join(chunks))
+        self.cache.set(key, result)
+        self.semantic.set("recipe", ingredients, preferences, result, title)
+
+    async def refine_recipe_async(self, title, content, change=None, servings=None, sections=None):
+        """Apply a change to an existing recipe, regenerating only the sections it affects
+
+        Servings are scaled locally from the parsed quantities; the model only sees the rest.
+        """
+        servings, sections, change = refine.plan_change(change, servings, sections)
+        text = content
+        if servings:
+            text = refine.scale_servings(text, servings)
+        if not change:
+            result = self._recipe_result(title, text)
+            return {**result, "sections": [], "servings": servings}
 
+        async def generate():
+            prompt = prompts.sections_prompt(title, text, sections, change)
+            return await self.engine.generate(self.model, prompt.text, generation_config=prompt.config)
+
+        key = make_key("sections", "", change, title, sections=sections, content=text)
+        try:
+            reply = await self.cache.get_or_compute(key, lambda: self.limiter.call(generate))
+        except (RateLimitExceeded, Overloaded):
+            raise
         except Exception as e:
             return {"title": "Error", "content": str(e)}
+        text, replaced = refine.splice_sections(text, reply, sections)
+        result = self._recipe_result(title, text)
+        return {**result, "sections": replaced, "servings": servings}
 
 class PantryManager:
-    def __init__(self, pantry_file="grandmas_pantry.json"):
+    def __init__(self, pantry_file="grandmas_pantry.jsonl", store=None, legacy_file="grandmas_pantry.json"):
         self.pantry_file = pantry_file
+        self.legacy_file = legacy_file
+        self.store = store or state.pantry_store(pantry_file)
+        self.index = RecipeIndex()
+        self.order = InsertionOrder()
+        # Bulk imports write from a worker thread while the event loop keeps serving saves
+        self._lock = threading.RLock()
         self.load_pantry()
 
+    @property
+    def version(self):
+        """Store revision: the same for every worker sharing a store"""
+        return self.store.revision
+
     def load_pantry(self):
-        """Load saved recipes from file"""
+        """Load saved recipes from the store"""
+        rows = self.store.load_rows()
+        self._set_pantry(rows)
+        if PANTRY_COMPRESSION and not all(is_packed(recipe) for _, recipe in rows):
+            # One-off rewrite of recipes saved before compression
+            self.save_pantry()
+        if not self.pantry and self.legacy_file and os.path.exists(self.legacy_file):
+            self._import_legacy()
+
+    def _put(self, record, seq=None):
+        self.pantry.pop(record['title'], None)
+        self.pantry[record['title']] = record
+        self.index.add(record)
+        self.order.add(record['title'], seq)
+
+    def _drop(self, title):
+        self.pantry.pop(title, None)
+        self.index.remove(title)
+        self.order.remove(title)
+
+    def _set_pantry(self, rows):
+        """Rebuild the title map and search index from (row id, recipe) pairs; later saves of a title win"""
+        self.pantry = {}
+        self.index.clear()
+        self.order.clear()
+        for seq, recipe in rows:
+            self._put(pack_recipe(recipe), seq)
+
+    def _refresh(self):
+        """Apply what other worker processes have written to a shared store
+
+        Only new rows and deleted row ids are read, so the cost follows the size of the change;
+        a full rewrite by another worker (rare: migrations) still reloads everything.
+        """
+        with self._lock:
+            changes = self.store.changes()
+            if changes is None:
+                return
+            kind, rows, deleted = changes
+            if kind == 'reload':
+                self._set_pantry(rows)
+                return
+            for seq in deleted:
+                title = self.order.title_at(seq)
+                if title is not None:
+                    self._drop(title)
+            for seq, recipe in rows:
+                self._put(pack_recipe(recipe), seq)
+
+    def _import_legacy(self):
+        """Move recipes from the old single-document JSON pantry into the store"""
         try:
-            with open(self.pantry_file, 'r') as f:
-                self.pantry = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.pantry = []
+            with open(self.legacy_file, 'r') as f:
+                self._set_pantry((None, recipe) for recipe in json.load(f))
+        except json.JSONDecodeError:
+            return
+        print(f"Migrating {len(self.pantry)} recipes from {self.legacy_file}", file=sys.stderr)
+        self.save_pantry()
 
     def save_pantry(self):
-        """Save recipes to file"""
-        with open(self.pantry_file, 'w') as f:
-            json.dump(self.pantry, f, indent=4)
+        """Rewrite the store from the in-memory pantry, in save order"""
+        titles = self.order.in_order()
+        row_ids = self.store.rewrite([self.pantry[title] for title in titles])
+        for title, seq in zip(titles, row_ids):
+            if seq is not None:
+                # The store numbered the rows afresh: follow it so cursors match other workers
+                self.order.add(title, seq)
 
     def add_recipe(self, recipe_data):
-        """Add a recipe to the pantry"""
+        """Add a recipe to the pantry, replacing any recipe with the same title"""
         recipe_data['saved_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.pantry.append(recipe_data)
-        self.save_pantry()
-        return self.get_recipe_list()
+        if 'recipe' not in recipe_data and recipe_data.get('content'):
+            recipe_data['recipe'] = parse_recipe(recipe_data['content'], recipe_data.get('title')).to_dict()
+        with self._lock:
+            self._refresh()
+            title = recipe_data['title']
+            if title in self.pantry:
+                self.store.remove(title)
+            record = pack_recipe(recipe_data)
+            self._put(record, self.store.append(record))
+            if self.store.needs_compaction():
+                self.save_pantry()
+            return recipe_data
+
+    def add_many(self, records):
+        """Save already packed records in one store write, replacing any with the same titles
+
+        Returns the titles that replaced an existing recipe.
+        """
+        with self._lock:
+            self._refresh()
+            replaced = [record['title'] for record in records if record['title'] in self.pantry]
+            row_ids = self.store.append_many(records, replaced)
+            for record, seq in zip(records, row_ids):
+                self._put(record, seq)
+            if self.store.needs_compaction():
+                self.save_pantry()
+            return replaced
+
+    def iter_recipes(self):
+        """Every saved recipe in save order, as stored (packed); callers decompress one at a time
+
+        Iterates over a snapshot of the records, so a concurrent import can't change it mid-export.
+        """
+        with self._lock:
+            self._refresh()
+            records = [self.pantry[title] for title in self.order.in_order()]
+        yield from records
 
     def remove_recipe(self, recipe_title):
-        """Remove a recipe from the pantry"""
-        self.pantry = [r for r in self.pantry if r['title'] != recipe_title]
-        self.save_pantry()
-        return self.get_recipe_list()
+        """Remove a recipe from the pantry, returning whether it was there"""
+        with self._lock:
+            self._refresh()
+            if recipe_title not in self.pantry:
+                return False
+            self._drop(recipe_title)
+            self.store.remove(recipe_title)
+            if self.store.needs_compaction():
+                self.save_pantry()
+            return True
+
+    @property
+    def etag(self):
+        with self._lock:
+            self._refresh()
+            return f'W/"{self.store.epoch}-{self.store.revision}"'
+
+    def list_page(self, cursor=0, limit=100):
+        """One page of saved titles in save order, plus the cursor for the next page"""
+        with self._lock:
+            self._refresh()
+            return self.order.page(cursor, limit)
+
+    def close(self):
+        """Flush batched writes"""
+        self.store.close()
 
     def get_recipe_list(self):
         """Get list of saved recipe titles"""
-        return [recipe['title'] for recipe in self.pantry]
+        with self._lock:
+            self._refresh()
+            return list(self.pantry)
 
     def get_recipe(self, title):
-        """Get a specific recipe by title"""
-        for recipe in self.pantry:
-            if recipe['title'] == title:
-                return recipe
-        return None
+        """Get a specific recipe by title, decompressing only this one"""
+        with self._lock:
+            self._refresh()
+            record = self.pantry.get(title)
+        return unpack_recipe(record) if record is not None else None
+
+    def search(self, query):
+        """Titles of saved recipes whose title or ingredients match every query term"""
+        with self._lock:
+            self._refresh()
+            return sorted(self.index.search(query))
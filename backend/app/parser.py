@@ -0,0 +1,212 @@
+import re
+from dataclasses import asdict, dataclass, field
+from fractions import Fraction
+from typing import List, Optional
+
+UNICODE_FRACTIONS = {'½': 0.5, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 0.25, '¾': 0.75, '⅛': 0.125}
+
+UNITS = {
+    'cup': 'cup', 'cups': 'cup', 'c': 'cup',
+    'tablespoon': 'tbsp', 'tablespoons': 'tbsp', 'tbsp': 'tbsp', 'tbs': 'tbsp', 'tbl': 'tbsp',
+    'teaspoon': 'tsp', 'teaspoons': 'tsp', 'tsp': 'tsp',
+    'gram': 'g', 'grams': 'g', 'g': 'g', 'kilogram': 'kg', 'kilograms': 'kg', 'kg': 'kg',
+    'millilitre': 'ml', 'milliliter': 'ml', 'millilitres': 'ml', 'milliliters': 'ml', 'ml': 'ml',
+    'litre': 'l', 'liter': 'l', 'litres': 'l', 'liters': 'l', 'l': 'l',
+    'ounce': 'oz', 'ounces': 'oz', 'oz': 'oz', 'pound': 'lb', 'pounds': 'lb', 'lb': 'lb', 'lbs': 'lb',
+    'pinch': 'pinch', 'pinches': 'pinch', 'dash': 'dash', 'handful': 'handful', 'handfuls': 'handful',
+    'clove': 'clove', 'cloves': 'clove', 'can': 'can', 'cans': 'can', 'tin': 'can', 'tins': 'can',
+    'slice': 'slice', 'slices': 'slice', 'sprig': 'sprig', 'sprigs': 'sprig',
+    'bunch': 'bunch', 'bunches': 'bunch', 'stick': 'stick', 'sticks': 'stick',
+}
+
+SECTIONS = {
+    'DESCRIPTION': 'description',
+    'PREPARATION TIME': 'prep',
+    'PREP TIME': 'prep',
+    'COOKING TIME': 'cook',
+    'COOK TIME': 'cook',
+    'SERVINGS': 'servings',
+    'INGREDIENTS': 'ingredients',
+    'INSTRUCTIONS': 'instructions',
+    'METHOD': 'instructions',
+    'TIPS': 'tips',
+}
+
+# A header is followed by a colon (and maybe its value) or stands alone, so "Cooking time may vary" is not one
+HEADER_RE = re.compile(r'^(' + '|'.join(SECTIONS) + r')\b\s*(?::\s*(.*)|$)', re.IGNORECASE)
+ITEM_RE = re.compile(r'^(?:[-*•]|\d+[.)])\s*(.+)$')
+TITLE_LINE_RE = re.compile(r'^\W*\d+\s*[.):-]\s*(.+)$')
+SET_HEADER_RE = re.compile(r'^\W*SET\s+(\d+)\W*$', re.IGNORECASE)
+QUANTITY_RE = re.compile(
+    r'^(?P<qty>\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?(?:\s*[½⅓⅔¼¾⅛])?|[½⅓⅔¼¾⅛])'
+    r'(?:\s*-\s*(?P<upper>\d+(?:\.\d+)?))?\s*(?P<rest>.*)$'
+)
+HOURS_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(?:hours?|hrs?)\b', re.IGNORECASE)
+MINUTES_RE = re.compile(r'(\d+)\s*(?:minutes?|mins?)\b', re.IGNORECASE)
+NUMBER_RE = re.compile(r'\d+')
+
+
+@dataclass(slots=True)
+class Ingredient:
+    name: str
+    quantity: Optional[float] = None
+    unit: Optional[str] = None
+    group: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Recipe:
+    title: str
+    description: str = ""
+    prep_minutes: Optional[int] = None
+    cook_minutes: Optional[int] = None
+    servings: Optional[int] = None
+    ingredients: List[Ingredient] = field(default_factory=list)
+    steps: List[str] = field(default_factory=list)
+    tips: List[str] = field(default_factory=list)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _clean(line):
+    """Strip markdown emphasis and surrounding whitespace"""
+    return line.replace('**', '').replace('__', '').strip().strip('#').strip()
+
+
+def parse_quantity(text):
+    """Parse '1 1/2', '3/4', '2.5' or '½' into a float"""
+    text = text.strip()
+    total = 0.0
+    for part in text.split():
+        if part in UNICODE_FRACTIONS:
+            total += UNICODE_FRACTIONS[part]
+        elif part[-1] in UNICODE_FRACTIONS:
+            total += float(part[:-1]) + UNICODE_FRACTIONS[part[-1]]
+        else:
+            total += float(Fraction(part))
+    return total
+
+
+def parse_ingredient(text, group=None):
+    """Split an ingredient line into quantity, unit and name"""
+    match = QUANTITY_RE.match(text)
+    if not match:
+        return Ingredient(name=text, group=group)
+    try:
+        quantity = parse_quantity(match.group('qty'))
+    except (ValueError, ZeroDivisionError):
+        return Ingredient(name=text, group=group)
+    rest = match.group('rest')
+    word, _, remainder = rest.partition(' ')
+    unit = UNITS.get(word.lower().rstrip('.'))
+    if unit:
+        rest = remainder
+        if rest.lower().startswith('of '):
+            rest = rest[3:]
+    return Ingredient(name=rest.strip(), quantity=quantity, unit=unit, group=group)
+
+
+def parse_minutes(text):
+    """Parse '15 minutes', '1 hour 20 minutes' or '45' into minutes"""
+    hours = HOURS_RE.search(text)
+    minutes = MINUTES_RE.search(text)
+    if hours or minutes:
+        total = float(hours.group(1)) * 60 if hours else 0
+        return int(total + (int(minutes.group(1)) if minutes else 0))
+    number = NUMBER_RE.search(text)
+    return int(number.group()) if number else None
+
+
+def parse_titles(text):
+    """Extract numbered titles from the model output, in order and without duplicates"""
+    titles = []
+    seen = set()
+    for line in text.splitlines():
+        match = TITLE_LINE_RE.match(_clean(line))
+        if not match:
+            continue
+        title = match.group(1).strip(' .-*"\'')
+        if title and title.lower() not in seen:
+            seen.add(title.lower())
+            titles.append(title)
+    return titles
+
+
+def parse_batch_titles(text):
+    """Split a combined titles answer into {set number: titles} using its [SET n] headers"""
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        header = SET_HEADER_RE.match(line.strip())
+        if header:
+            current = sections.setdefault(int(header.group(1)), [])
+        elif current is not None:
+            current.append(line)
+    return {number: parse_titles("\n".join(lines)) for number, lines in sections.items()}
+
+
+def split_sections(text):
+    """Split recipe text into [section, lines] blocks, keeping every raw line
+
+    The block before the first header is 'title'; joining all lines gives back the text.
+    """
+    blocks = [['title', []]]
+    for raw in text.splitlines():
+        header = HEADER_RE.match(_clean(raw))
+        if header:
+            blocks.append([SECTIONS[header.group(1).upper()], [raw]])
+        else:
+            blocks[-1][1].append(raw)
+    return blocks
+
+
+def parse_recipe(text, title=None):
+    """Parse the generated recipe text into a Recipe in a single pass over its lines"""
+    recipe = Recipe(title=title or "")
+    section = None
+    description = []
+    group = None
+
+    for raw in text.splitlines():
+        line = _clean(raw)
+        if not line:
+            continue
+
+        header = HEADER_RE.match(line)
+        if header:
+            section = SECTIONS[header.group(1).upper()]
+            value = (header.group(2) or "").strip()
+            if section == 'prep':
+                recipe.prep_minutes = parse_minutes(value)
+            elif section == 'cook':
+                recipe.cook_minutes = parse_minutes(value)
+            elif section == 'servings':
+                number = NUMBER_RE.search(value)
+                recipe.servings = int(number.group()) if number else None
+            elif section == 'description' and value:
+                description.append(value)
+            continue
+
+        if section is None:
+            # Lines before DESCRIPTION hold the [TITLE] marker and the title itself
+            if not recipe.title and line != '[TITLE]':
+                recipe.title = line.strip('[]')
+            continue
+
+        item = ITEM_RE.match(line)
+        text_value = item.group(1).strip() if item else line
+        if section == 'description':
+            description.append(line)
+        elif section == 'ingredients':
+            if not item and line.endswith(':'):
+                group = line.rstrip(':').strip()
+            else:
+                recipe.ingredients.append(parse_ingredient(text_value, group))
+        elif section == 'instructions':
+            recipe.steps.append(text_value)
+        elif section == 'tips':
+            recipe.tips.append(text_value)
+
+    recipe.description = " ".join(description)
+    return recipe
@@ -0,0 +1,119 @@
+import asyncio
+import os
+from .admission import PREFETCH, Overloaded, request_priority
+from .cache import make_key
+from .metrics import current_endpoint
+from .ratelimit import RateLimitExceeded, TokenBucket
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+# Speculative generations allowed per minute, drawn from the shared Gemini quota
+PREFETCH_BUDGET_PER_MINUTE = float(os.getenv("PREFETCH_BUDGET_PER_MINUTE", "5"))
+# Share of the shared limiter's burst that must be idle before prefetching, kept for interactive requests
+PREFETCH_MIN_HEADROOM = float(os.getenv("PREFETCH_MIN_HEADROOM", "0.5"))
+PREFETCH_MAX_TITLES = int(os.getenv("PREFETCH_MAX_TITLES", "5"))
+PREFETCH_MAX_READY = 4096
+
+
+class Prefetcher:
+    def __init__(self, generator, concurrency=PREFETCH_CONCURRENCY,
+                 budget_per_minute=PREFETCH_BUDGET_PER_MINUTE, max_titles=PREFETCH_MAX_TITLES):
+        """Speculatively generate full recipes for freshly returned titles"""
+        self.generator = generator
+        self.max_titles = max_titles
+        self.budget = TokenBucket(budget_per_minute / 60.0, max(1, int(budget_per_minute)))
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._groups = {}
+        self._ready = {}
+        self.scheduled = 0
+        self.completed = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.used = 0
+
+    def schedule(self, titles, ingredients, preferences=None):
+        """Queue background generation for each title, replacing any earlier run for these ingredients"""
+        group = make_key("titles", ingredients, preferences)
+        self.cancel(ingredients, preferences)
+        tasks = []
+        # A failed titles call returns placeholders; a recipe for one is not worth the quota
+        fallback = self.generator.fallback_title(ingredients)
+        for title in [t for t in dict.fromkeys(titles) if t != fallback][:self.max_titles]:
+            key = make_key("recipe", ingredients, preferences, title)
+            if key in self._ready:
+                continue
+            tasks.append(asyncio.create_task(self._prefetch(key, title, ingredients, preferences)))
+        self.scheduled += len(tasks)
+        if tasks:
+            self._groups[group] = tasks
+            for task in tasks:
+                task.add_done_callback(lambda _, group=group, tasks=tasks: self._finish(group, tasks))
+        return len(tasks)
+
+    def _finish(self, group, tasks):
+        if self._groups.get(group) is tasks and all(task.done() for task in tasks):
+            del self._groups[group]
+
+    async def _prefetch(self, key, title, ingredients, preferences):
+        # Tasks run in a copy of the scheduling context; label their timings separately
+        current_endpoint.set("prefetch")
+        request_priority.set(PREFETCH)
+        async with self._semaphore:
+            if self.generator.cache.peek(key) is not None:
+                # Already generated, e.g. for an earlier identical request
+                self.skipped += 1
+                return
+            # Only spend quota that is both in the prefetch budget and well clear of what users need
+            bucket = self.generator.limiter.bucket
+            if bucket.available() < max(1.0, PREFETCH_MIN_HEADROOM * bucket.capacity) + 1:
+                self.skipped += 1
+                return
+            try:
+                self.budget.reserve(deadline=0)
+            except RateLimitExceeded:
+                self.skipped += 1
+                return
+            try:
+                recipe = await self.generator.generate_full_recipe_async(title, ingredients, preferences)
+            except (RateLimitExceeded, Overloaded):
+                self.skipped += 1
+                return
+            if recipe.get("title") != "Error":
+                self._ready[key] = True
+                if len(self._ready) > PREFETCH_MAX_READY:
+                    del self._ready[next(iter(self._ready))]
+                self.completed += 1
+
+    def cancel(self, ingredients, preferences=None):
+        """Cancel outstanding speculative work for an ingredient set"""
+        tasks = self._groups.pop(make_key("titles", ingredients, preferences), [])
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+                self.cancelled += 1
+        return len(tasks)
+
+    def cancel_all(self):
+        for tasks in self._groups.values():
+            for task in tasks:
+                task.cancel()
+        self._groups.clear()
+
+    def record_use(self, title, ingredients, preferences=None):
+        """Count a recipe request that was served from prefetched work"""
+        key = make_key("recipe", ingredients, preferences, title)
+        if key in self._ready:
+            del self._ready[key]
+            self.used += 1
+            return True
+        return False
+
+    def stats(self):
+        return {
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "cancelled": self.cancelled,
+            "used": self.used,
+            "pending_groups": len(self._groups),
+        }
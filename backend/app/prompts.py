@@ -0,0 +1,198 @@
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from .metrics import Counter, Histogram, registry
+
+# Caps on user supplied fields, in estimated tokens
+PROMPT_INGREDIENTS_BUDGET = int(os.getenv("PROMPT_INGREDIENTS_BUDGET", "120"))
+PROMPT_PREFERENCES_BUDGET = int(os.getenv("PROMPT_PREFERENCES_BUDGET", "60"))
+PROMPT_TITLE_BUDGET = int(os.getenv("PROMPT_TITLE_BUDGET", "24"))
+PROMPT_RECIPE_BUDGET = int(os.getenv("PROMPT_RECIPE_BUDGET", "1500"))
+PROMPT_CHANGE_BUDGET = int(os.getenv("PROMPT_CHANGE_BUDGET", "60"))
+# Output caps and sampling per endpoint; five titles fit comfortably in 256 tokens
+TITLES_MAX_OUTPUT_TOKENS = int(os.getenv("TITLES_MAX_OUTPUT_TOKENS", "256"))
+RECIPE_MAX_OUTPUT_TOKENS = int(os.getenv("RECIPE_MAX_OUTPUT_TOKENS", "1536"))
+SECTIONS_MAX_OUTPUT_TOKENS = int(os.getenv("SECTIONS_MAX_OUTPUT_TOKENS", "768"))
+TITLES_TEMPERATURE = float(os.getenv("TITLES_TEMPERATURE", "1.0"))
+RECIPE_TEMPERATURE = float(os.getenv("RECIPE_TEMPERATURE", "0.7"))
+
+GENERATION_CONFIG = {
+    "titles": {"max_output_tokens": TITLES_MAX_OUTPUT_TOKENS, "temperature": TITLES_TEMPERATURE},
+    "recipe": {"max_output_tokens": RECIPE_MAX_OUTPUT_TOKENS, "temperature": RECIPE_TEMPERATURE},
+    "sections": {"max_output_tokens": SECTIONS_MAX_OUTPUT_TOKENS, "temperature": RECIPE_TEMPERATURE},
+}
+
+TITLES_TEMPLATE = (
+    "Create 5 very different recipe titles using these ingredients: {ingredients}\n"
+    "{preferences}"
+    "Rules: each uses a different cooking method and cuisine influence; creative and appetizing; "
+    "3-7 words; numbered 1-5, one per line; titles only.\n"
+)
+BATCH_TITLES_TEMPLATE = (
+    "For each numbered ingredient set below, create 5 very different recipe titles.\n"
+    "{sets}"
+    "Rules: each uses a different cooking method and cuisine influence; creative and appetizing; "
+    "3-7 words; follow each set's preferences.\n"
+    "Answer with a [SET n] line for every set, then its titles numbered 1-5, one per line; titles only.\n"
+)
+RECIPE_TEMPLATE = (
+    "Write a detailed recipe for: {title}\n"
+    "Using these ingredients: {ingredients}\n"
+    "{preferences}"
+    "Use exactly this format:\n"
+    "[TITLE]\n"
+    "{title}\n"
+    "DESCRIPTION:\n"
+    "<2-3 sentences>\n"
+    "PREPARATION TIME: <X> minutes\n"
+    "COOKING TIME: <X> minutes\n"
+    "SERVINGS: <X>\n"
+    "INGREDIENTS:\n"
+    "- <ingredient with exact measurement>\n"
+    "INSTRUCTIONS:\n"
+    "1. <step>\n"
+    "TIPS:\n"
+    "- <2-3 tips for this recipe>\n"
+)
+SECTIONS_TEMPLATE = (
+    "Revise this recipe for: {title}\n"
+    "Change requested: {change}\n"
+    "Rewrite only these sections: {headers}\n"
+    "Reply with just those sections, each starting with its header line, in the same format as below.\n"
+    "---\n"
+    "{recipe}\n"
+)
+SECTION_HEADERS = {
+    'description': 'DESCRIPTION', 'prep': 'PREPARATION TIME', 'cook': 'COOKING TIME', 'servings': 'SERVINGS',
+    'ingredients': 'INGREDIENTS', 'instructions': 'INSTRUCTIONS', 'tips': 'TIPS',
+}
+
+CONTROL_RE = re.compile(r"[\x00-\x08\x0b-\x1f\x7f]")
+
+prompt_tokens = registry.register(Histogram(
+    "recipe_prompt_tokens_estimated", "Estimated prompt size in tokens", ("kind",),
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096)))
+prompt_truncations_total = registry.register(Counter(
+    "recipe_prompt_truncations_total", "User fields cut down to fit the prompt budget", ("field",)))
+
+
+@dataclass(slots=True)
+class Prompt:
+    kind: str
+    text: str
+    config: dict = field(default_factory=dict)
+    estimated_tokens: int = 0
+    truncated: list = field(default_factory=list)
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English)"""
+    return math.ceil(len(text) / 4)
+
+
+def normalize_field(text):
+    """Single-line text with control characters removed and whitespace collapsed"""
+    return " ".join(CONTROL_RE.sub(" ", text or "").split())
+
+
+def clip(text, budget):
+    """Cut text to about `budget` tokens at a word boundary"""
+    limit = budget * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    return cut[:cut.rfind(" ")] if " " in cut else cut
+
+
+def compact_ingredients(ingredients, budget=PROMPT_INGREDIENTS_BUDGET):
+    """Comma separated ingredients de-duplicated in order, and whether any were cut to fit the budget"""
+    if isinstance(ingredients, str):
+        ingredients = ingredients.split(',')
+    seen = set()
+    items = []
+    used = 0
+    truncated = False
+    for item in map(normalize_field, ingredients):
+        if not item or item.lower() in seen:
+            continue
+        cost = estimate_tokens(item + ", ")
+        if used + cost > budget:
+            truncated = True
+            if items:
+                break
+            item = clip(item, budget)
+        seen.add(item.lower())
+        items.append(item)
+        used += cost
+    return ", ".join(items), truncated
+
+
+def _fields(ingredients, preferences):
+    compacted, cut = compact_ingredients(ingredients)
+    truncated = ["ingredients"] if cut else []
+    preferences = normalize_field(preferences)
+    clipped = clip(preferences, PROMPT_PREFERENCES_BUDGET)
+    if clipped != preferences:
+        truncated.append("preferences")
+    return compacted, f"Preferences: {clipped}\n" if clipped else "", truncated
+
+
+def _finish(kind, text, truncated):
+    prompt = Prompt(kind, text, dict(GENERATION_CONFIG[kind]), estimate_tokens(text), truncated)
+    prompt_tokens.observe(prompt.estimated_tokens, kind)
+    for name in truncated:
+        prompt_truncations_total.inc(name)
+    return prompt
+
+
+def titles_prompt(ingredients, preferences=None):
+    """Prompt and generation config for five recipe titles"""
+    ingredients, preferences, truncated = _fields(ingredients, preferences)
+    return _finish("titles", TITLES_TEMPLATE.format(ingredients=ingredients, preferences=preferences), truncated)
+
+
+def batch_titles_prompt(requests):
+    """One prompt asking for titles for several (ingredients, preferences) requests"""
+    sets = []
+    truncated = []
+    for number, (ingredients, preferences) in enumerate(requests, 1):
+        ingredients, preferences, cut = _fields(ingredients, preferences)
+        sets.append(f"Set {number} ingredients: {ingredients}\n")
+        if preferences:
+            sets.append(f"Set {number} {preferences[0].lower()}{preferences[1:]}")
+        truncated += cut
+    prompt = _finish("titles", BATCH_TITLES_TEMPLATE.format(sets="".join(sets)), truncated)
+    prompt.config["max_output_tokens"] *= len(requests)
+    return prompt
+
+
+def recipe_prompt(title, ingredients, preferences=None):
+    """Prompt and generation config for a full recipe in the format the parser reads"""
+    ingredients, preferences, truncated = _fields(ingredients, preferences)
+    clean_title = normalize_field(title)
+    clipped = clip(clean_title, PROMPT_TITLE_BUDGET)
+    if clipped != clean_title:
+        truncated.append("title")
+    text = RECIPE_TEMPLATE.format(title=clipped, ingredients=ingredients, preferences=preferences)
+    return _finish("recipe", text, truncated)
+
+
+def sections_prompt(title, recipe_text, sections, change):
+    """Prompt asking for replacement text for some sections of an existing recipe"""
+    truncated = []
+    clean_change = normalize_field(change)
+    change = clip(clean_change, PROMPT_CHANGE_BUDGET)
+    if change != clean_change:
+        truncated.append("change")
+    recipe_text = recipe_text.strip()
+    if estimate_tokens(recipe_text) > PROMPT_RECIPE_BUDGET:
+        recipe_text = recipe_text[:PROMPT_RECIPE_BUDGET * 4]
+        truncated.append("recipe")
+    text = SECTIONS_TEMPLATE.format(
+        title=clip(normalize_field(title), PROMPT_TITLE_BUDGET),
+        change=change,
+        headers=", ".join(SECTION_HEADERS[s] for s in sections),
+        recipe=recipe_text,
+    )
+    return _finish("sections", text, truncated)
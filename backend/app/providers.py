@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from .parser import split_sections
+from .prompts import SECTION_HEADERS
+from .startup import timed
+
+MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "gemini")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+
+class ModelProvider:
+    """A model backend: generate_content returning `.text`, plus generate_content_async if it has one
+
+    Providers without generate_content_async run in the engine's bounded thread pool.
+    """
+    name = "base"
+
+    def load(self):
+        """Prepare the backend; called lazily before the first generation"""
+        return self
+
+    async def load_async(self):
+        return self.load()
+
+    def generate_content(self, prompt, **kwargs):
+        raise NotImplementedError
+
+
+class GeminiProvider(ModelProvider):
+    def __init__(self, model_name=GEMINI_MODEL):
+        """Google Gemini; the SDK is imported and configured on first use"""
+        self.model_name = model_name
+        self.name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._model is not None:
+                return self._model
+            api_key = os.getenv('GEMINI_API_KEY')
+            if not api_key:
+                raise RuntimeError("GEMINI_API_KEY environment variable not set")
+            print("Initializing Gemini model...")
+            with timed("google.generativeai"):
+                import google.generativeai as genai
+            with timed("model_init"):
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            print("Model initialized successfully!")
+            return self._model
+
+    async def load_async(self):
+        """Load off the event loop the first time it is needed"""
+        if self._model is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.load)
+        return self._model
+
+    def generate_content(self, prompt, **kwargs):
+        return self.load().generate_content(prompt, **kwargs)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        model = await self.load_async()
+        return await model.generate_content_async(prompt, stream=stream, **kwargs)
+
+
+class FakeRateLimitError(Exception):
+    code = 429
+
+    def __str__(self):
+        return "429 RATE_LIMIT_EXCEEDED (fake provider)"
+
+
+class FakeUsage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+
+
+class FakeResponse:
+    def __init__(self, text, prompt=""):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt, text)
+
+
+class FakeStream:
+    def __init__(self, provider, prompt, text):
+        self.provider = provider
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt, text)
+
+    async def __aiter__(self):
+        for chunk in self.provider.chunks(self.text):
+            await asyncio.sleep(self.provider.chunk_delay)
+            yield FakeResponse(chunk)
+
+
+class FakeProvider(ModelProvider):
+    STYLES = ['Grilled', 'Baked', 'Braised', 'Roasted', 'Stir-Fried', 'Poached', 'Smoked', 'Pan-Seared']
+    CUISINES = ['Tuscan', 'Thai', 'Moroccan', 'Nordic', 'Mexican', 'Japanese', 'Provençal', 'Punjabi']
+
+    def __init__(self, latency=None, jitter=None, error_rate=None, rate_limit_rate=None,
+                 chunk_delay=None, seed=None):
+        """Deterministic local stand-in for Gemini with configurable latency and failures"""
+        self.name = "fake"
+        self.latency = float(os.getenv("FAKE_MODEL_LATENCY", "0.5")) if latency is None else latency
+        self.jitter = float(os.getenv("FAKE_MODEL_JITTER", "0.1")) if jitter is None else jitter
+        self.error_rate = float(os.getenv("FAKE_MODEL_ERROR_RATE", "0")) if error_rate is None else error_rate
+        self.rate_limit_rate = (float(os.getenv("FAKE_MODEL_429_RATE", "0"))
+                                if rate_limit_rate is None else rate_limit_rate)
+        self.chunk_delay = float(os.getenv("FAKE_MODEL_CHUNK_DELAY", "0.02")) if chunk_delay is None else chunk_delay
+        self._random = random.Random(int(os.getenv("FAKE_MODEL_SEED", "0")) if seed is None else seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _outcome(self):
+        """Pick latency and failure mode for one call"""
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        if roll < self.rate_limit_rate:
+            return delay, FakeRateLimitError()
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, RuntimeError("fake provider error")
+        return delay, None
+
+    def _pick(self, prompt, options, salt):
+        digest = hashlib.sha1(f"{salt}:{prompt}".encode()).digest()
+        return options[digest[0] % len(options)]
+
+    def _subject(self, prompt, marker):
+        line = next((l for l in prompt.splitlines() if marker in l), "")
+        return line.split(marker, 1)[-1].strip() or "Pantry"
+
+    def render(self, prompt):
+        """Plausible model output for a titles, combined titles, section rewrite or recipe prompt"""
+        if "Rewrite only these sections:" in prompt:
+            return self._render_sections(prompt)
+        if "ingredient set below" in prompt:
+            sets = [l.split(" ingredients:", 1) for l in prompt.splitlines()
+                    if l.startswith("Set ") and " ingredients:" in l]
+            return "\n".join(
+                f"[SET {number.split()[1]}]\n" + self.render(f"recipe titles\ningredients:{ingredients}")
+                for number, ingredients in sets
+            )
+        if "recipe titles" in prompt:
+            main = self._subject(prompt, "ingredients:").split(',')[0].strip().title()
+            return "\n".join(
+                f"{i}. {self._pick(prompt, self.CUISINES, i)} {self._pick(prompt, self.STYLES, -i)} {main} Plate {i}"
+                for i in range(1, 6)
+            )
+        title = self._subject(prompt, "recipe for:")
+        ingredients = [i.strip() for i in self._subject(prompt, "ingredients:").split(',') if i.strip()]
+        lines = [
+            "[TITLE]", title,
+            "DESCRIPTION:", f"A simple {title.lower()} made in one pan. Ready for a weeknight.",
+            "PREPARATION TIME: 15 minutes", "COOKING TIME: 30 minutes", "SERVINGS: 4",
+            "INGREDIENTS:",
+        ]
+        lines += [f"- {n * 100} g {name}" for n, name in enumerate(ingredients, 1)]
+        lines += ["- 2 tbsp olive oil", "- 1 tsp salt", "INSTRUCTIONS:"]
+        lines += [f"{n}. Prepare the {name}." for n, name in enumerate(ingredients, 1)]
+        lines += [f"{len(ingredients) + 1}. Cook everything together until done.", "TIPS:",
+                  "- Season as you go.", "- Rest for 5 minutes before serving."]
+        return "\n".join(lines)
+
+    def _render_sections(self, prompt):
+        """Requested sections of the quoted recipe, minus lines naming anything after 'no'/'without'"""
+        wanted = self._subject(prompt, "Rewrite only these sections:").split(", ")
+        change = self._subject(prompt, "Change requested:").lower()
+        dropped = re.findall(r"(?:no|without)\s+(\w+)", change)
+        recipe = prompt.split("---\n", 1)[-1]
+        lines = []
+        for section, block in split_sections(recipe):
+            if SECTION_HEADERS.get(section) in wanted:
+                lines += [l for l in block if not any(w in l.lower() for w in dropped)]
+        return "\n".join(lines)
+
+    def chunks(self, text, size=64):
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        delay, error = self._outcome()
+        time.sleep(delay)
+        if error:
+            raise error
+        text = self.render(prompt)
+        if stream:
+            return [FakeResponse(chunk) for chunk in self.chunks(text)]
+        return FakeResponse(text, prompt)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        delay, error = self._outcome()
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        text = self.render(prompt)
+        if stream:
+            return FakeStream(self, prompt, text)
+        return FakeResponse(text, prompt)
+
+
+def build_provider(name=None):
+    """Model provider selected by MODEL_PROVIDER ('gemini', 'fake', a Gemini model name,
+    or a comma separated list of these to route across)"""
+    name = name or MODEL_PROVIDER
+    if ',' in name:
+        from .routing import ProviderRouter
+        return ProviderRouter([build_provider(n.strip()) for n in name.split(',') if n.strip()])
+    if name == "fake":
+        return FakeProvider()
+    if name == "gemini":
+        return GeminiProvider()
+    if name.startswith("gemini"):
+        return GeminiProvider(name)
+    raise ValueError(f"Unknown model provider: {name}")
@@ -0,0 +1,176 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from fastapi import HTTPException
+from .metrics import observe_phase
+from .state import state
+
+# Client-side quota for Gemini, shared by every request in the process
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "15"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "5"))
+# Longest a request may wait for quota before failing fast
+RATE_LIMIT_DEADLINE = float(os.getenv("RATE_LIMIT_DEADLINE", "10"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+RATE_LIMIT_BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "1"))
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, retry_after):
+        """429 response telling the client when to come back"""
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=429,
+            detail=f"Rate limit exceeded. Please try again in {self.retry_after} seconds.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+def is_rate_limit_error(error):
+    """Check whether a provider error is a 429 / quota error"""
+    if isinstance(error, RateLimitExceeded):
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    # Gemini names the quota reason explicitly; bare "429"/"quota" substrings match unrelated errors
+    return "RATE_LIMIT_EXCEEDED" in str(error)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """Token bucket refilled at `rate` tokens per second"""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, deadline=None):
+        """Take a token and return how long the caller must wait before using it
+
+        Raises RateLimitExceeded without taking a token if the wait would exceed the deadline.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if deadline is not None and wait > deadline:
+                raise RateLimitExceeded(wait)
+            self.tokens -= 1
+            return wait
+
+    def expected_wait(self):
+        """Seconds until the next token is free"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+    def available(self):
+        """Tokens in the bucket right now"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+
+class StateTokenBucket:
+    def __init__(self, state, name, rate, capacity):
+        """TokenBucket kept in a state backend, so worker processes draw on one quota"""
+        self.state = state
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    def reserve(self, deadline=None):
+        wait, taken = self.state.take(self.name, self.rate, self.capacity, deadline)
+        if not taken:
+            raise RateLimitExceeded(wait)
+        return wait
+
+    def expected_wait(self):
+        return self.state.take(self.name, self.rate, self.capacity, peek=True)[0]
+
+    def available(self):
+        return self.state.level(self.name, self.rate, self.capacity)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE, burst=GEMINI_BURST,
+                 deadline=RATE_LIMIT_DEADLINE, max_retries=RATE_LIMIT_MAX_RETRIES,
+                 backoff_base=RATE_LIMIT_BACKOFF_BASE, state=None):
+        """Smooth calls to the provider and retry 429s with jittered backoff"""
+        if state is not None and state.shared:
+            self.bucket = StateTokenBucket(state, "gemini", requests_per_minute / 60.0, burst)
+        else:
+            self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.retries = 0
+        self.rejected = 0
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+    def _next_delay(self, attempt, started):
+        remaining = self.deadline - (time.monotonic() - started)
+        delay = self._backoff(attempt)
+        if attempt >= self.max_retries - 1 or delay > remaining:
+            self.rejected += 1
+            raise RateLimitExceeded(max(delay, self.bucket.expected_wait()))
+        self.retries += 1
+        return delay
+
+    def _reserve(self, started):
+        try:
+            return self.bucket.reserve(self.deadline - (time.monotonic() - started))
+        except RateLimitExceeded:
+            self.rejected += 1
+            raise
+
+    async def acquire(self):
+        """Wait for one unit of quota without retrying, e.g. before opening a stream"""
+        wait = self._reserve(time.monotonic())
+        if wait:
+            await asyncio.sleep(wait)
+        observe_phase("rate_limit_wait", wait)
+
+    async def call(self, operation):
+        """Await `operation()` once quota is available"""
+        started = time.monotonic()
+        waited = 0.0
+        for attempt in range(self.max_retries):
+            wait = self._reserve(started)
+            if wait:
+                await asyncio.sleep(wait)
+            observe_phase("rate_limit_wait", waited + wait)
+            waited = 0.0
+            try:
+                return await operation()
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                delay = self._next_delay(attempt, started)
+                print(f"Rate limit hit, retrying in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+                waited = delay
+
+    def stats(self):
+        """Retry and rejection counters"""
+        return {
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "expected_wait": round(self.bucket.expected_wait(), 3),
+        }
+
+
+# One limiter per process so every generator shares the quota; with shared state, one per host
+rate_limiter = RateLimiter(state=state)
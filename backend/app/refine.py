@@ -0,0 +1,132 @@
+import re
+from fractions import Fraction
+from .parser import QUANTITY_RE, parse_ingredient, parse_quantity, parse_recipe, split_sections
+
+# A number is only a servings count after a servings verb ("serve 3", "feeds 6") or before a
+# servings noun ("for 6 people", "scale to 4 servings"); "bake for 20 minutes" is left alone
+SERVINGS_NOUNS = r'(?:people|persons|servings|portions|guests)'
+SERVINGS_RE = re.compile(
+    r'\b(?:serves?|serving|feeds?)\s+(?:only\s+)?(\d+)\b(?:\s*' + SERVINGS_NOUNS + r'\b)?'
+    r'|\b(?:(?:for|to)\s+)?(\d+)\s*' + SERVINGS_NOUNS + r'\b',
+    re.IGNORECASE,
+)
+ITEM_PREFIX_RE = re.compile(r'^(\s*(?:[-*•]|\d+[.)])?\s*)(.*)$')
+WORD_RE = re.compile(r"[a-z]+")
+# Words that can surround a servings change without asking for anything else
+FILLER = {
+    'make', 'it', 'this', 'please', 'scale', 'change', 'the', 'recipe', 'so', 'that', 'just', 'only',
+    'instead', 'and', 'a', 'serve', 'serves', 'serving', 'feed', 'feeds', 'people', 'persons', 'servings',
+    'portions', 'guests', 'to', 'for', 'of',
+}
+# Keywords that point a change request at particular sections
+SECTION_HINTS = {
+    'description': ('description', 'describe', 'intro', 'summary'),
+    'tips': ('tip', 'advice', 'store', 'storage', 'leftover', 'make ahead'),
+    'instructions': ('step', 'method', 'instruction', 'oven', 'grill', 'bake', 'fry', 'slow cooker',
+                     'quicker', 'faster', 'simpler', 'easier', 'technique'),
+    'ingredients': ('no ', 'without', 'instead', 'swap', 'replace', 'substitute', 'add ', 'extra', 'less ',
+                    'more ', 'vegan', 'vegetarian', 'gluten', 'dairy', 'allerg', 'spic', 'chili', 'chilli',
+                    'salt', 'sugar', 'healthier', 'low '),
+}
+TIME_HINTS = ('quicker', 'faster', 'time', 'minutes', 'hour')
+
+
+def format_quantity(quantity, unit=None):
+    """Kitchen-friendly number: whole grams/millilitres, fractions for spoons, cups and counts"""
+    if unit in ('g', 'ml') or quantity >= 10:
+        return str(max(1, round(quantity)))
+    if unit in ('kg', 'l'):
+        return f"{quantity:.2f}".rstrip('0').rstrip('.')
+    fraction = Fraction(quantity).limit_denominator(8) or Fraction(1, 8)
+    whole, part = divmod(fraction, 1)
+    if not part:
+        return str(whole)
+    return f"{whole} {part}" if whole else str(part)
+
+
+def scale_line(line, factor):
+    """Scale the leading quantity (or range) of one ingredient line"""
+    prefix, body = ITEM_PREFIX_RE.match(line).groups()
+    match = QUANTITY_RE.match(body)
+    if not match:
+        return line
+    try:
+        quantity = parse_quantity(match.group('qty'))
+    except (ValueError, ZeroDivisionError):
+        return line
+    rest = match.group('rest')
+    unit = parse_ingredient(body).unit
+    scaled = format_quantity(quantity * factor, unit)
+    if match.group('upper'):
+        scaled += "-" + format_quantity(float(match.group('upper')) * factor, unit)
+    return f"{prefix}{scaled} {rest}".rstrip()
+
+
+def scale_servings(text, servings):
+    """Rewrite quantities and the SERVINGS line for a new number of servings, without the model"""
+    current = parse_recipe(text).servings
+    if not current:
+        raise ValueError("Recipe has no SERVINGS line to scale from")
+    factor = servings / current
+    lines = []
+    for section, block in split_sections(text):
+        if section == 'servings':
+            block = [re.sub(r'\d+', str(servings), block[0], count=1)] + block[1:]
+        elif section == 'ingredients':
+            block = block[:1] + [scale_line(line, factor) for line in block[1:]]
+        lines += block
+    return "\n".join(lines)
+
+
+def plan_change(change, servings=None, sections=None):
+    """Split a change request into (servings, sections to regenerate, change left for the model)"""
+    change = (change or "").strip()
+    match = SERVINGS_RE.search(change)
+    if match and servings is None:
+        servings = int(match.group(1) or match.group(2))
+    if servings is not None and servings < 1:
+        raise ValueError("Servings must be at least 1")
+    if match:
+        remainder = (change[:match.start()] + change[match.end():]).strip(" ,.;")
+    else:
+        remainder = change
+    if not set(WORD_RE.findall(remainder.lower())) - FILLER:
+        remainder = ""
+    if sections is None and remainder:
+        lowered = f" {remainder.lower()} "
+        sections = [name for name, hints in SECTION_HINTS.items() if any(h in lowered for h in hints)]
+        if 'ingredients' in sections and 'instructions' not in sections:
+            # Steps name their ingredients, so they have to follow an ingredient change
+            sections.append('instructions')
+        if any(h in lowered for h in TIME_HINTS):
+            sections += ['prep', 'cook']
+        sections = sections or ['ingredients', 'instructions']
+    return servings, list(dict.fromkeys(sections or [])), remainder
+
+
+def splice_sections(text, reply, sections):
+    """Replace the given sections of `text` with the same sections from `reply`
+
+    Returns the new text and the sections that were actually replaced.
+    """
+    replies = {section: block for section, block in split_sections(reply) if section in sections}
+    lines = []
+    replaced = []
+    for section, block in split_sections(text):
+        new = replies.pop(section, None)
+        if new is not None:
+            while new and not new[-1].strip():
+                new = new[:-1]
+            # Keep the blank lines that separated this section from the next
+            trailing = len(block) - len(list(_rstrip_blank(block)))
+            block = new + [""] * trailing
+            replaced.append(section)
+        lines += block
+    return "\n".join(lines), replaced
+
+
+def _rstrip_blank(block):
+    end = len(block)
+    while end and not block[end - 1].strip():
+        end -= 1
+    return block[:end]
@@ -1,42 +1,255 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+import json
+import os
+from .metrics import Gauge, TimedJSONResponse, TimedORJSONResponse, registry
 from .models import RecipeGenerator, PantryManager
+from .parser import parse_recipe
+from .prompts import SECTION_HEADERS
+from .prefetch import PREFETCH_ENABLED, Prefetcher
+from .batch import run_batch, validate_jobs
+from .cache import response_cache
+from .admission import Overloaded
+from .ratelimit import RateLimitExceeded
+from .state import state
+from .startup import startup_report, timed
+from .transfer import PantryImport, export_lines, read_lines
 
 router = APIRouter()
 
+PANTRY_PAGE_SIZE = int(os.getenv("PANTRY_PAGE_SIZE", "100"))
+PANTRY_MAX_PAGE_SIZE = int(os.getenv("PANTRY_MAX_PAGE_SIZE", "500"))
+
 # Initialize recipe generator and pantry manager
 recipe_generator = RecipeGenerator()
-pantry_manager = PantryManager()
+with timed("pantry_load"):
+    pantry_manager = PantryManager(os.getenv("PANTRY_FILE", "grandmas_pantry.jsonl"))
+prefetcher = Prefetcher(recipe_generator)
+
+# Counters owned by other components, read at scrape time
+for name, help, read, kind in [
+    ("recipe_cache_hits_total", "Response cache hits", lambda: response_cache.hits, "counter"),
+    ("recipe_cache_misses_total", "Response cache misses", lambda: response_cache.misses, "counter"),
+    ("recipe_cache_coalesced_total", "Requests collapsed onto an in-flight call", lambda: response_cache.coalesced, "counter"),
+    ("recipe_semantic_cache_hits_total", "Requests served from a near-duplicate ingredient set", lambda: recipe_generator.semantic.hits, "counter"),
+    ("recipe_semantic_cache_misses_total", "Near-duplicate lookups with no close enough match", lambda: recipe_generator.semantic.misses, "counter"),
+    ("recipe_rate_limit_retries_total", "Retries after provider 429s", lambda: recipe_generator.limiter.retries, "counter"),
+    ("recipe_rate_limit_rejected_total", "Requests failed fast with 429", lambda: recipe_generator.limiter.rejected, "counter"),
+    ("recipe_generations_in_flight", "Model calls currently running", lambda: recipe_generator.engine.in_flight, "gauge"),
+    ("recipe_admission_queue_depth", "Generation requests waiting for a slot", lambda: recipe_generator.engine.admission.queued, "gauge"),
+    ("recipe_pantry_size", "Saved recipes", lambda: len(pantry_manager.pantry), "gauge"),
+    ("recipe_state_fallbacks_total", "Shared-state calls served locally because the state file was locked", lambda: state.fallbacks, "counter"),
+]:
+    registry.register(Gauge(name, help, read, kind))
 
 @router.post("/api/generate-titles")
 async def generate_titles(request: Request):
     data = await request.json()
-    titles = recipe_generator.generate_titles(data['ingredients'], data.get('preferences'))
-    return JSONResponse({"titles": titles})
+    titles = await recipe_generator.generate_titles_async(data['ingredients'], data.get('preferences'))
+    # Clients may opt out of prefetching, but only the operator can turn it on
+    if PREFETCH_ENABLED and data.get('prefetch', True):
+        prefetcher.schedule(titles, data['ingredients'], data.get('preferences'))
+    return TimedJSONResponse({"titles": titles})
 
 @router.post("/api/generate-recipe")
 async def generate_recipe(request: Request):
     data = await request.json()
-    recipe = recipe_generator.generate_full_recipe(
+    prefetched = prefetcher.record_use(data['title'], data['ingredients'], data.get('preferences'))
+    recipe = await recipe_generator.generate_full_recipe_async(
         data['title'], 
         data['ingredients'], 
         data.get('preferences')
     )
-    return JSONResponse(recipe)
+    return TimedJSONResponse(recipe, headers={"X-Prefetched": "1" if prefetched else "0"})
+
+@router.post("/api/prefetch/cancel")
+async def cancel_prefetch(request: Request):
+    data = await request.json()
+    cancelled = prefetcher.cancel(data['ingredients'], data.get('preferences'))
+    return TimedJSONResponse({"cancelled": cancelled})
+
+@router.get("/api/prefetch/stats")
+async def prefetch_stats():
+    return TimedJSONResponse(prefetcher.stats())
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/api/generate-recipe/stream")
+async def generate_recipe_stream(request: Request):
+    data = await request.json()
+    title = data['title']
+
+    async def events():
+        content = []
+        try:
+            async for text in recipe_generator.stream_full_recipe(
+                title,
+                data['ingredients'],
+                data.get('preferences')
+            ):
+                content.append(text)
+                yield sse_event("chunk", {"text": text})
+            text = "".join(content)
+            yield sse_event("done", {
+                "title": title,
+                "content": text,
+                "recipe": parse_recipe(text, title).to_dict()
+            })
+        except (RateLimitExceeded, Overloaded) as e:
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail, "retry_after": e.retry_after})
+        except Exception as e:
+            yield sse_event("error", {"status": 500, "detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/api/refine-recipe")
+async def refine_recipe(request: Request):
+    data = await request.json()
+    title = data.get('title')
+    content = data.get('content')
+    if not content and title:
+        saved = pantry_manager.get_recipe(title)
+        content = saved and saved.get('content')
+    if not content:
+        return TimedJSONResponse({"error": "Recipe content or a saved title is required"}, status_code=400)
+    if not data.get('change') and data.get('servings') is None:
+        return TimedJSONResponse({"error": "Change or servings is required"}, status_code=400)
+    try:
+        servings = int(data['servings']) if data.get('servings') is not None else None
+    except (TypeError, ValueError):
+        servings = 0
+    if servings is not None and servings < 1:
+        return TimedJSONResponse({"error": "Servings must be a whole number of at least 1"}, status_code=400)
+    sections = data.get('sections')
+    if sections is not None and (not sections or any(s not in SECTION_HEADERS for s in sections)):
+        return TimedJSONResponse(
+            {"error": f"Sections must be from: {', '.join(SECTION_HEADERS)}"}, status_code=400)
+    try:
+        recipe = await recipe_generator.refine_recipe_async(
+            title or parse_recipe(content).title, content, data.get('change'), servings, sections)
+    except ValueError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=400)
+    return TimedJSONResponse(recipe)
+
+@router.post("/api/batch/generate")
+async def batch_generate(request: Request):
+    data = await request.json()
+    jobs = validate_jobs(data.get('jobs'))
+
+    async def lines():
+        async for result in run_batch(recipe_generator, jobs):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @router.post("/api/save-recipe")
 async def save_recipe(request: Request):
     data = await request.json()
-    updated_list = pantry_manager.add_recipe(data)
-    return JSONResponse({"recipes": updated_list})
+    if not data.get('title'):
+        return TimedJSONResponse({"error": "Title is required"}, status_code=400)
+    recipe = pantry_manager.add_recipe(data)
+    return TimedJSONResponse(
+        {"added": recipe['title'], "recipe": recipe.get('recipe'), "version": pantry_manager.version},
+        headers={"ETag": pantry_manager.etag}
+    )
 
 @router.post("/api/remove-recipe")
 async def remove_recipe(request: Request):
     data = await request.json()
-    updated_list = pantry_manager.remove_recipe(data['title'])
-    return JSONResponse({"recipes": updated_list})
+    recipe_title = data.get('title')
+    if not recipe_title:
+        return TimedJSONResponse({"error": "Title is required"}, status_code=400)
+    if not pantry_manager.remove_recipe(recipe_title):
+        return TimedJSONResponse({"error": "Recipe not found"}, status_code=404)
+    return TimedJSONResponse(
+        {"removed": recipe_title, "version": pantry_manager.version},
+        headers={"ETag": pantry_manager.etag}
+    )
 
 @router.get("/api/recipes")
-async def get_recipes():
-    recipes = pantry_manager.get_recipe_list()
-    return JSONResponse({"recipes": recipes})
\ No newline at end of file
+async def get_recipes(request: Request, cursor: int = 0, limit: int = PANTRY_PAGE_SIZE):
+    etag = pantry_manager.etag
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    limit = max(1, min(limit, PANTRY_MAX_PAGE_SIZE))
+    recipes, next_cursor = pantry_manager.list_page(cursor, limit)
+    return TimedORJSONResponse(
+        {"recipes": recipes, "next_cursor": next_cursor, "version": pantry_manager.version},
+        headers={"ETag": etag}
+    )
+
+@router.get("/api/recipes/export")
+async def export_recipes():
+    return StreamingResponse(
+        export_lines(pantry_manager.iter_recipes()),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="pantry.ndjson"'}
+    )
+
+@router.post("/api/recipes/import")
+async def import_recipes(request: Request, batch_size: int = 0):
+    job = PantryImport(pantry_manager, batch_size) if batch_size > 0 else PantryImport(pantry_manager)
+    # Validation, compression and store writes run in a worker thread, one batch of lines at a time,
+    # so a large import doesn't stall other requests
+    lines = []
+    async for line in read_lines(request.stream()):
+        lines.append(line)
+        if len(lines) >= job.batch_size:
+            await run_in_threadpool(job.feed_lines, lines)
+            lines = []
+    await run_in_threadpool(job.feed_lines, lines)
+    await run_in_threadpool(job.flush)
+    return TimedJSONResponse(
+        {**job.report(), "version": pantry_manager.version},
+        headers={"ETag": pantry_manager.etag}
+    )
+
+@router.get("/api/recipes/search")
+async def search_recipes(q: str = ""):
+    return TimedORJSONResponse({"query": q, "recipes": pantry_manager.search(q)})
+
+@router.get("/api/recipe")
+async def get_recipe(title: str = ""):
+    recipe = pantry_manager.get_recipe(title)
+    if recipe is None:
+        return TimedJSONResponse({"error": "Recipe not found"}, status_code=404)
+    return TimedORJSONResponse(recipe)
+
+@router.post("/api/warmup")
+async def warm_up():
+    ready = await recipe_generator.warm_up()
+    return TimedJSONResponse({"ready": ready}, status_code=200 if ready else 503)
+
+@router.get("/api/startup")
+async def startup():
+    return TimedJSONResponse(startup_report())
+
+@router.get("/api/titles/batch-stats")
+async def title_batch_stats():
+    batcher = recipe_generator.batcher
+    return TimedJSONResponse(batcher.stats() if batcher is not None else {"enabled": False})
+
+@router.get("/api/admission/stats")
+async def admission_stats():
+    return TimedJSONResponse(recipe_generator.engine.admission.stats())
+
+@router.get("/api/providers/stats")
+async def provider_stats():
+    provider = recipe_generator.provider
+    stats = provider.stats() if hasattr(provider, "stats") else {provider.name: {}}
+    return TimedJSONResponse(stats)
+
+@router.get("/api/cache/stats")
+async def cache_stats():
+    return TimedJSONResponse({**response_cache.stats(), "semantic": recipe_generator.semantic.stats()})
+
+@router.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
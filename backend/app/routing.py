@@ -0,0 +1,227 @@
+import asyncio
+import functools
+import os
+import time
+from collections import deque
+from .metrics import Counter, registry
+from .providers import ModelProvider
+from .ratelimit import is_rate_limit_error
+
+# Wait at least this long before hedging, and use it until a provider has enough samples for a p95
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+HEDGE_MAX_EXTRA = int(os.getenv("HEDGE_MAX_EXTRA", "1"))
+HEDGE_MIN_SAMPLES = 20
+# Consecutive failures before a provider is benched, and for how long
+CIRCUIT_FAILURES = int(os.getenv("PROVIDER_CIRCUIT_FAILURES", "3"))
+CIRCUIT_COOLDOWN = float(os.getenv("PROVIDER_CIRCUIT_COOLDOWN", "30"))
+
+provider_calls_total = registry.register(Counter(
+    "recipe_provider_calls_total", "Model calls per provider and outcome", ("provider", "outcome")))
+hedges_total = registry.register(Counter(
+    "recipe_hedged_calls_total", "Duplicate calls issued because the first was slow or failed", ("reason",)))
+
+
+def valid_response(response):
+    """A response counts if it carries non-empty text"""
+    try:
+        return bool(response.text and response.text.strip())
+    except Exception:
+        # The Gemini SDK raises on .text for blocked or empty candidates
+        return False
+
+
+class ProviderHealth:
+    def __init__(self, window=200):
+        """Rolling latency and success statistics for one provider"""
+        self.latencies = deque(maxlen=window)
+        self.success_rate = 1.0
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record(self, ok, latency=None, alpha=0.1):
+        self.success_rate = (1 - alpha) * self.success_rate + alpha * (1.0 if ok else 0.0)
+        if ok:
+            self.failures = 0
+            self.latencies.append(latency)
+        else:
+            self.failures += 1
+            if self.failures >= CIRCUIT_FAILURES:
+                self.open_until = time.monotonic() + CIRCUIT_COOLDOWN
+
+    def available(self):
+        return time.monotonic() >= self.open_until
+
+    def p95(self):
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def typical_latency(self):
+        if not self.latencies:
+            return HEDGE_MIN_DELAY
+        ordered = sorted(self.latencies)
+        return ordered[len(ordered) // 2]
+
+    def score(self):
+        """Higher is better: reliable and fast, benched providers last"""
+        if not self.available():
+            return -1.0
+        return self.success_rate / (self.typical_latency() + 0.05)
+
+
+class ProviderRouter(ModelProvider):
+    def __init__(self, providers, hedge_min_delay=HEDGE_MIN_DELAY, max_extra=HEDGE_MAX_EXTRA,
+                 validator=valid_response):
+        """Route calls across several model providers with hedging and failover"""
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers = list(providers)
+        self.name = "router(" + ",".join(p.name for p in self.providers) + ")"
+        self.health = {id(p): ProviderHealth() for p in self.providers}
+        self.hedge_min_delay = hedge_min_delay
+        self.max_extra = max_extra
+        self.validator = validator
+
+    def ranked(self):
+        """Providers ordered by health score, best first"""
+        return sorted(self.providers, key=lambda p: self.health[id(p)].score(), reverse=True)
+
+    def _hedge_delay(self, provider):
+        p95 = self.health[id(provider)].p95()
+        return max(self.hedge_min_delay, p95) if p95 is not None else self.hedge_min_delay
+
+    def load(self):
+        loaded = 0
+        for provider in self.providers:
+            try:
+                provider.load()
+                loaded += 1
+            except Exception as e:
+                print(f"Error loading provider {provider.name}: {e}")
+        if not loaded:
+            raise RuntimeError("No model provider could be loaded")
+        return self
+
+    async def load_async(self):
+        results = await asyncio.gather(*(p.load_async() for p in self.providers), return_exceptions=True)
+        if all(isinstance(r, Exception) for r in results):
+            raise results[0]
+        return self
+
+    async def _attempt(self, provider, prompt, **kwargs):
+        health = self.health[id(provider)]
+        started = time.perf_counter()
+        try:
+            if hasattr(provider, "generate_content_async"):
+                response = await provider.generate_content_async(prompt, **kwargs)
+            else:
+                call = functools.partial(provider.generate_content, prompt, **kwargs)
+                response = await asyncio.get_running_loop().run_in_executor(None, call)
+        except asyncio.CancelledError:
+            provider_calls_total.inc(provider.name, "cancelled")
+            raise
+        except Exception:
+            health.record(False)
+            provider_calls_total.inc(provider.name, "error")
+            raise
+        if not self.validator(response):
+            health.record(False)
+            provider_calls_total.inc(provider.name, "invalid")
+            raise ValueError(f"Invalid response from {provider.name}")
+        health.record(True, time.perf_counter() - started)
+        provider_calls_total.inc(provider.name, "ok")
+        return response
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            return await self._stream(prompt, **kwargs)
+
+        candidates = self.ranked()
+        budget = 1 + self.max_extra
+        pending = {}
+        errors = []
+
+        def launch():
+            provider = candidates.pop(0)
+            task = asyncio.create_task(self._attempt(provider, prompt, **kwargs))
+            pending[task] = provider
+            return provider
+
+        primary = launch()
+        launched = 1
+        try:
+            while pending:
+                timeout = self._hedge_delay(primary) if candidates and launched < budget else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than this provider's p95: race a duplicate on the next best backend
+                    hedges_total.inc("slow")
+                    primary = launch()
+                    launched += 1
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+                    if candidates:
+                        # A failed attempt doesn't use up the hedge budget: replace it straight away
+                        hedges_total.inc("failover")
+                        primary = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        rate_limited = [e for e in errors if is_rate_limit_error(e)]
+        raise (rate_limited or errors)[-1]
+
+    async def _stream(self, prompt, **kwargs):
+        """Open a stream on the healthiest provider that accepts it"""
+        errors = []
+        for provider in self.ranked():
+            if not hasattr(provider, "generate_content_async"):
+                # Blocking streams can't be handed back to the event loop as they are
+                continue
+            try:
+                response = await provider.generate_content_async(prompt, stream=True, **kwargs)
+                provider_calls_total.inc(provider.name, "stream")
+                return response
+            except Exception as e:
+                self.health[id(provider)].record(False)
+                provider_calls_total.inc(provider.name, "error")
+                errors.append(e)
+        if not errors:
+            raise RuntimeError("No provider supports async streaming")
+        raise errors[-1]
+
+    def generate_content(self, prompt, **kwargs):
+        """Blocking path: try providers in health order until one answers"""
+        errors = []
+        for provider in self.ranked():
+            health = self.health[id(provider)]
+            started = time.perf_counter()
+            try:
+                response = provider.generate_content(prompt, **kwargs)
+            except Exception as e:
+                health.record(False)
+                errors.append(e)
+                continue
+            if kwargs.get("stream") or self.validator(response):
+                health.record(True, time.perf_counter() - started)
+                return response
+            health.record(False)
+            errors.append(ValueError(f"Invalid response from {provider.name}"))
+        raise errors[-1]
+
+    def stats(self):
+        """Per-provider health used for routing"""
+        return {
+            provider.name: {
+                "score": round(self.health[id(provider)].score(), 3),
+                "success_rate": round(self.health[id(provider)].success_rate, 3),
+                "p95": self.health[id(provider)].p95(),
+                "available": self.health[id(provider)].available(),
+            }
+            for provider in self.providers
+        }
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from .cache import RESPONSE_CACHE_TTL, canonical_ingredients
+from .startup import timed
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity a past request must reach before its result is reused; it must also have used
+# every ingredient asked for, so one extra ingredient is never answered with a recipe that leaves it out
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+# Words that describe the state or size of an ingredient rather than what it is
+MODIFIERS = {
+    'fresh', 'new', 'baby', 'young', 'large', 'small', 'medium', 'big', 'ripe', 'raw', 'whole',
+    'chopped', 'diced', 'sliced', 'grated', 'frozen', 'dried', 'canned', 'tinned',
+    'boneless', 'skinless', 'organic', 'free', 'range', 'some', 'a', 'an', 'the', 'of', 'few',
+}
+SYNONYMS = {
+    'spring onion': 'scallion', 'green onion': 'scallion',
+    'courgette': 'zucchini', 'aubergine': 'eggplant', 'coriander': 'cilantro',
+    'garbanzo': 'chickpea', 'garbanzo bean': 'chickpea', 'prawn': 'shrimp', 'king prawn': 'shrimp',
+    'capsicum': 'bell pepper', 'beef mince': 'ground beef', 'mince': 'ground beef',
+    'rocket': 'arugula', 'spud': 'potato', 'tomatoe': 'tomato', 'potatoe': 'potato',
+    'chicken breast': 'chicken', 'chicken thigh': 'chicken', 'salmon fillet': 'salmon',
+    'cod fillet': 'cod', 'beetroot': 'beet', 'swede': 'rutabaga', 'mangetout': 'snow pea',
+    'maize': 'corn', 'sweetcorn': 'corn',
+    'caster sugar': 'sugar', 'plain flour': 'flour', 'all purpose flour': 'flour',
+}
+
+
+_np = None
+
+
+def _numpy():
+    """numpy, imported when the first entry is stored rather than at startup"""
+    global _np
+    if _np is None:
+        with timed("numpy"):
+            import numpy
+        _np = numpy
+    return _np
+
+
+def singular(word):
+    """Fold simple English plurals"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('es') and word[-3] in 'osxh':
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient(name):
+    """Canonical name for one ingredient: plurals folded, modifiers dropped, synonyms mapped"""
+    words = [singular(w) for w in WORD_RE.findall(name.lower()) if w not in MODIFIERS]
+    phrase = " ".join(words)
+    if phrase in SYNONYMS:
+        return SYNONYMS[phrase]
+    # Otherwise map word by word, so "courgette ribbons" still matches "zucchini ribbons"
+    return " ".join(SYNONYMS.get(w, w) for w in words)
+
+
+def ingredient_set(ingredients):
+    return {n for n in (normalize_ingredient(i) for i in canonical_ingredients(ingredients)) if n}
+
+
+def vectorize(names, dim=SEMANTIC_CACHE_DIM):
+    """Unit-length hashed bag-of-ingredients vector for a set of normalized names"""
+    np = _numpy()
+    vector = np.zeros(dim, dtype=np.float32)
+    for name in names:
+        digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+        vector[int.from_bytes(digest, 'little') % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _group_key(kind, preferences, title):
+    return (kind, " ".join((preferences or "").lower().split()), " ".join((title or "").lower().split()))
+
+
+class SemanticCache:
+    def __init__(self, max_entries=SEMANTIC_CACHE_MAX_ENTRIES, dim=SEMANTIC_CACHE_DIM,
+                 threshold=SEMANTIC_CACHE_THRESHOLD, ttl=RESPONSE_CACHE_TTL):
+        """Reuse results for requests whose ingredient sets are near-duplicates of a past one"""
+        self.max_entries = max_entries
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl = ttl
+        # One row per entry, allocated on first use; requests only match rows in the same
+        # (kind, preferences, title) group
+        self.vectors = None
+        self.values = [None] * max_entries
+        self.names = [frozenset()] * max_entries
+        self.group_ids = {}
+        self.hits = 0
+        self.misses = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def _allocate(self):
+        if self.vectors is None:
+            np = _numpy()
+            self.vectors = np.zeros((self.max_entries, self.dim), dtype=np.float32)
+            self.groups = np.full(self.max_entries, -1, dtype=np.int32)
+            self.last_used = np.zeros(self.max_entries, dtype=np.int64)
+            self.expires = np.zeros(self.max_entries, dtype=np.float64)
+
+    def _scores(self, gid, vector):
+        scores = self.vectors @ vector
+        scores[(self.groups != gid) | (self.expires < time.monotonic())] = -1.0
+        return scores
+
+    def _best(self, gid, vector):
+        """Row and similarity of the closest live entry in a group"""
+        scores = self._scores(gid, vector)
+        row = int(scores.argmax())
+        return row, float(scores[row])
+
+    def _match(self, gid, vector, names):
+        """Closest live entry in a group that is similar enough and used every ingredient in `names`"""
+        np = _numpy()
+        scores = self._scores(gid, vector)
+        rows = np.flatnonzero(scores >= self.threshold)
+        for row in rows[np.argsort(-scores[rows], kind='stable')]:
+            # Hashed vectors can collide, so check the actual ingredient names
+            if names <= self.names[row]:
+                return int(row)
+        return None
+
+    def get(self, kind, ingredients, preferences=None, title=None):
+        if not self.group_ids:
+            self.misses += 1
+            return None
+        names = frozenset(ingredient_set(ingredients))
+        vector = vectorize(names, self.dim)
+        with self._lock:
+            gid = self.group_ids.get(_group_key(kind, preferences, title))
+            if gid is None or not names:
+                self.misses += 1
+                return None
+            row = self._match(gid, vector, names)
+            if row is None:
+                self.misses += 1
+                return None
+            self._clock += 1
+            self.last_used[row] = self._clock
+            self.hits += 1
+            return self.values[row]
+
+    def set(self, kind, ingredients, preferences, value, title=None):
+        names = frozenset(ingredient_set(ingredients))
+        if not names:
+            return
+        vector = vectorize(names, self.dim)
+        with self._lock:
+            self._allocate()
+            gid = self.group_ids.setdefault(_group_key(kind, preferences, title), len(self.group_ids))
+            row, score = self._best(gid, vector)
+            if score < 0.999 or self.names[row] != names:
+                # Not already stored: take a free slot, or evict the least recently used entry
+                row = int(self.last_used.argmin())
+            self._clock += 1
+            self.vectors[row] = vector
+            self.groups[row] = gid
+            self.last_used[row] = self._clock
+            self.expires[row] = time.monotonic() + self.ttl
+            self.values[row] = value
+            self.names[row] = names
+
+    def __len__(self):
+        return 0 if self.vectors is None else int((self.groups >= 0).sum())
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self),
+            "threshold": self.threshold,
+        }
+
+
+class NullSemanticCache:
+    """Stand-in when the similarity tier is disabled"""
+    hits = 0
+    misses = 0
+
+    def get(self, kind, ingredients, preferences=None, title=None):
+        return None
+
+    def set(self, kind, ingredients, preferences, value, title=None):
+        pass
+
+    def stats(self):
+        return {"enabled": False}
+
+
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else NullSemanticCache()
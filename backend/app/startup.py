@@ -0,0 +1,21 @@
+import time
+from contextlib import contextmanager
+
+# Module import and initialization timings, in seconds, for the cold-start report
+STARTUP_REPORT = {}
+_started = time.perf_counter()
+
+
+@contextmanager
+def timed(label):
+    """Record how long the wrapped block took under `label`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_REPORT[label] = round(time.perf_counter() - start, 4)
+
+
+def startup_report():
+    """Timings collected so far plus time since this module was first imported"""
+    return {"timings": dict(STARTUP_REPORT), "uptime": round(time.perf_counter() - _started, 3)}
@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from .storage import JsonLinesStore, SQLiteStore, open_store
+
+# 'memory' keeps state per process; 'sqlite' shares it between workers on one host through STATE_DB
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB = os.getenv("STATE_DB", "recipe_state.db")
+# State calls run on the event loop, so a worker waits at most this long for another's write lock
+# and then serves the call from its own memory (per-process quota, no shared cache) instead
+STATE_BUSY_TIMEOUT_MS = int(os.getenv("STATE_BUSY_TIMEOUT_MS", "50"))
+# Expired keys are swept after this many writes
+STATE_PURGE_EVERY = 1000
+
+
+class MemoryState:
+    """State private to this process: the default for a single worker"""
+    shared = False
+    fallbacks = 0
+
+    def __init__(self):
+        self._values = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._values.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] < time.time():
+                del self._values[(namespace, key)]
+                return None
+            return entry[0]
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self._values[(namespace, key)] = (value, time.time() + ttl if ttl else None)
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set the key only if it is absent or expired; return whether it was set"""
+        with self._lock:
+            entry = self._values.get((namespace, key))
+            if entry is not None and (entry[1] is None or entry[1] >= time.time()):
+                return False
+            self._values[(namespace, key)] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._values.pop((namespace, key), None)
+
+    def take(self, name, rate, capacity, deadline=None, peek=False):
+        """Token bucket: take one token from `name` and return the wait before it may be used
+
+        Returns (wait, taken); nothing is taken when the wait would exceed the deadline or on a peek.
+        """
+        with self._lock:
+            now = time.time()
+            tokens, updated = self._buckets.get(name, (float(capacity), now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = max(0.0, (1 - tokens) / rate)
+            taken = not peek and (deadline is None or wait <= deadline)
+            self._buckets[name] = (tokens - 1 if taken else tokens, now)
+            return wait, taken
+
+    def level(self, name, rate, capacity):
+        """Tokens currently in bucket `name`"""
+        with self._lock:
+            tokens, updated = self._buckets.get(name, (float(capacity), time.time()))
+            return min(capacity, tokens + (time.time() - updated) * rate)
+
+    def pantry_store(self, pantry_file):
+        return open_store(pantry_file)
+
+    def close(self):
+        pass
+
+
+class SQLiteState:
+    def __init__(self, path=STATE_DB, busy_timeout_ms=STATE_BUSY_TIMEOUT_MS):
+        """State shared by every process that opens the same SQLite file (WAL mode)"""
+        self.shared = True
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._local = MemoryState()
+        self.fallbacks = 0
+        # Autocommit; multi-statement updates open their own IMMEDIATE transaction
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (namespace TEXT, key TEXT, value TEXT, expires REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _or_local(self, work, fallback):
+        """Run `work` against the shared file, or `fallback` against local state if it stays locked"""
+        try:
+            return work()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            self.fallbacks += 1
+            return fallback()
+
+    def _purge(self):
+        self._writes += 1
+        if self._writes % STATE_PURGE_EVERY == 0:
+            self._conn.execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+
+    def _get(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def get(self, namespace, key):
+        value = self._or_local(lambda: self._get(namespace, key), lambda: None)
+        # Also finds what was written locally while the file was locked
+        return value if value is not None else self._local.get(namespace, key)
+
+    def set(self, namespace, key, value, ttl=None):
+        def work():
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, separators=(',', ':')), time.time() + ttl if ttl else None),
+            )
+            self._purge()
+        self._or_local(lambda: self._transaction(work), lambda: self._local.set(namespace, key, value, ttl))
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set the key only if it is absent or expired; return whether it was set"""
+        def work():
+            self._conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? AND expires IS NOT NULL AND expires < ?",
+                (namespace, key, time.time()),
+            )
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO kv (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, separators=(',', ':')), time.time() + ttl if ttl else None),
+            )
+            return cursor.rowcount == 1
+        return self._or_local(lambda: self._transaction(work), lambda: self._local.add(namespace, key, value, ttl))
+
+    def delete(self, namespace, key):
+        def work():
+            with self._lock:
+                self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+        self._local.delete(namespace, key)
+        self._or_local(work, lambda: None)
+
+    def take(self, name, rate, capacity, deadline=None, peek=False):
+        """Token bucket shared across processes; same contract as MemoryState.take"""
+        def work():
+            now = time.time()
+            row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens, updated = row if row else (float(capacity), now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            wait = max(0.0, (1 - tokens) / rate)
+            taken = not peek and (deadline is None or wait <= deadline)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (name, tokens - 1 if taken else tokens, now),
+            )
+            return wait, taken
+        return self._or_local(lambda: self._transaction(work),
+                              lambda: self._local.take(name, rate, capacity, deadline, peek))
+
+    def _level(self, name, rate, capacity):
+        with self._lock:
+            row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return float(capacity)
+        return min(capacity, row[0] + max(0.0, time.time() - row[1]) * rate)
+
+    def level(self, name, rate, capacity):
+        return self._or_local(lambda: self._level(name, rate, capacity),
+                              lambda: self._local.level(name, rate, capacity))
+
+    def pantry_store(self, pantry_file):
+        """Shared SQLite pantry next to the pantry file, seeded once from an existing JSON-lines pantry
+
+        It is kept out of the state file so a long pantry write never holds up a quota or cache call.
+        """
+        if pantry_file.endswith(('.db', '.sqlite')):
+            return SQLiteStore(pantry_file)
+        path = os.path.splitext(pantry_file)[0] + ".db"
+        store = SQLiteStore(path)
+        if not store.load() and os.path.exists(pantry_file):
+            recipes = JsonLinesStore(pantry_file).load()
+            if recipes:
+                print(f"Importing {len(recipes)} recipes from {pantry_file} into {path}", file=sys.stderr)
+                store.rewrite(recipes)
+        return store
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def build_state(backend=None):
+    """State backend selected by STATE_BACKEND"""
+    backend = backend or STATE_BACKEND
+    if backend == "sqlite":
+        return SQLiteState(STATE_DB)
+    if backend == "memory":
+        return MemoryState()
+    raise ValueError(f"Unknown state backend: {backend}")
+
+
+state = build_state()
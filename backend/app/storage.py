@@ -0,0 +1,383 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Flush to disk after this many writes or this many seconds, whichever comes first
+FSYNC_EVERY = int(os.getenv("PANTRY_FSYNC_EVERY", "16"))
+FSYNC_INTERVAL = float(os.getenv("PANTRY_FSYNC_INTERVAL", "1.0"))
+# Compact once the log holds this many more records than there are live recipes
+COMPACT_SLACK = int(os.getenv("PANTRY_COMPACT_SLACK", "1000"))
+
+
+def _fsync_dir(path):
+    """Make a rename durable by syncing its directory"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JsonLinesStore:
+    def __init__(self, path, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL,
+                 compact_slack=COMPACT_SLACK):
+        """Append-only JSON-lines log of pantry puts and deletes"""
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_slack = compact_slack
+        self.records = 0
+        self.live = 0
+        # Single writer, so the revision is ours to count; the epoch tells restarts apart
+        self.epoch = uuid.uuid4().hex[:8]
+        self.revision = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _repair_tail(self):
+        """Drop a torn final line so the next append starts on a fresh line"""
+        try:
+            with open(self.path, 'rb+') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b'\n':
+                    return
+                f.seek(max(0, size - 65536))
+                tail = f.read()
+                cut = tail.rfind(b'\n')
+                f.truncate(size - len(tail) + cut + 1 if cut >= 0 else 0)
+        except FileNotFoundError:
+            pass
+
+    def load(self):
+        """Replay the log into a list of recipes"""
+        self._repair_tail()
+        recipes = {}
+        titles = {}
+        order = 0
+        self.records = 0
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash mid-append leaves at most one torn line at the end
+                        continue
+                    self.records += 1
+                    if entry.get('op') == 'put':
+                        recipes[order] = entry['recipe']
+                        titles.setdefault(entry['recipe'].get('title'), []).append(order)
+                        order += 1
+                    elif entry.get('op') == 'del':
+                        for key in titles.pop(entry['title'], []):
+                            del recipes[key]
+        except FileNotFoundError:
+            pass
+        pantry = list(recipes.values())
+        self.live = len(pantry)
+        return pantry
+
+    def load_rows(self):
+        """(None, recipe) pairs: a log has no row ids, so save order is numbered by the caller"""
+        return [(None, recipe) for recipe in self.load()]
+
+    def _entries(self):
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            return
+
+    def iter_recipes(self):
+        """Live recipes in save order, read straight from the log without holding them all
+
+        One pass finds where each title was last saved or deleted, a second yields the survivors.
+        The file is only read, so this is safe next to a running server.
+        """
+        last_put = {}
+        last_del = {}
+        for i, entry in enumerate(self._entries()):
+            if entry.get('op') == 'put':
+                last_put[entry['recipe'].get('title')] = i
+            elif entry.get('op') == 'del':
+                last_del[entry['title']] = i
+        for i, entry in enumerate(self._entries()):
+            if entry.get('op') == 'put':
+                title = entry['recipe'].get('title')
+                if last_put[title] == i and last_del.get(title, -1) < i:
+                    yield entry['recipe']
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        return self._file
+
+    def _write(self, entry):
+        with self._lock:
+            f = self._open()
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            f.flush()
+            self.records += 1
+            self.revision += 1
+            self._unsynced += 1
+            now = time.monotonic()
+            if self._unsynced >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                os.fsync(f.fileno())
+                self._unsynced = 0
+                self._last_sync = now
+
+    def append(self, recipe):
+        self._write({'op': 'put', 'recipe': recipe})
+        self.live += 1
+
+    def append_many(self, recipes, replaced=()):
+        """Delete the replaced titles and append the recipes with one write and at most one fsync"""
+        entries = [{'op': 'del', 'title': title} for title in replaced]
+        entries += [{'op': 'put', 'recipe': recipe} for recipe in recipes]
+        with self._lock:
+            f = self._open()
+            f.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+            self.records += len(entries)
+            self.revision += 1
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+        self.live += len(recipes) - len(replaced)
+        return [None] * len(recipes)
+
+    def remove(self, title):
+        self._write({'op': 'del', 'title': title})
+        self.live -= 1
+
+    def needs_compaction(self):
+        return self.records - self.live > self.compact_slack
+
+    def changes(self):
+        """The log has a single writer process, so it never changes underneath us"""
+        return None
+
+    def rewrite(self, recipes):
+        """Compact the log to one put per live recipe via write-to-temp and atomic rename"""
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            with open(tmp_path, 'w') as f:
+                for recipe in recipes:
+                    f.write(json.dumps({'op': 'put', 'recipe': recipe}, separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            os.replace(tmp_path, self.path)
+            _fsync_dir(self.path)
+            self.records = self.live = len(recipes)
+            self.revision += 1
+            self._unsynced = 0
+        return [None] * len(recipes)
+
+    def sync(self):
+        """Force any batched writes to disk"""
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        """Pantry stored in a SQLite table, one row per recipe; safe to share between processes"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS recipes (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, data TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS recipes_title ON recipes (title)")
+        # Bumped on every pantry write so other processes can tell their copy is stale; `rewritten` is
+        # the revision of the last full rewrite, after which row ids no longer line up
+        self._conn.execute("CREATE TABLE IF NOT EXISTS recipes_meta (id INTEGER PRIMARY KEY, revision INTEGER)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(recipes_meta)")}
+        if 'epoch' not in columns:
+            self._conn.execute("ALTER TABLE recipes_meta ADD COLUMN epoch TEXT")
+        if 'rewritten' not in columns:
+            self._conn.execute("ALTER TABLE recipes_meta ADD COLUMN rewritten INTEGER DEFAULT 0")
+        self._conn.execute("INSERT OR IGNORE INTO recipes_meta (id, revision, rewritten) VALUES (1, 0, 0)")
+        self._conn.execute("UPDATE recipes_meta SET epoch = ? WHERE id = 1 AND epoch IS NULL", (uuid.uuid4().hex[:8],))
+        # Deleted row ids, so other processes can drop them without reloading everything
+        self._conn.execute("CREATE TABLE IF NOT EXISTS recipes_deleted (seq INTEGER PRIMARY KEY AUTOINCREMENT, recipe_id INTEGER)")
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS recipes_tombstone AFTER DELETE ON recipes "
+            "BEGIN INSERT INTO recipes_deleted (recipe_id) VALUES (old.id); END"
+        )
+        self._conn.commit()
+        self.epoch = self._conn.execute("SELECT epoch FROM recipes_meta WHERE id = 1").fetchone()[0]
+        self._data_version = None
+        self.revision = None
+        self._rewritten = None
+        self._last_id = 0
+        self._last_deleted = 0
+
+    def _bump(self):
+        self._conn.execute("UPDATE recipes_meta SET revision = revision + 1 WHERE id = 1")
+
+    def _read_revision(self):
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return self._conn.execute("SELECT revision, rewritten FROM recipes_meta WHERE id = 1").fetchone()
+
+    def _insert(self, recipes):
+        return [
+            self._conn.execute(
+                "INSERT INTO recipes (title, data) VALUES (?, ?)",
+                (r.get('title'), json.dumps(r, separators=(',', ':'))),
+            ).lastrowid
+            for r in recipes
+        ]
+
+    def _load_rows(self):
+        rows = self._conn.execute("SELECT id, data FROM recipes ORDER BY id").fetchall()
+        self.revision, self._rewritten = self._read_revision()
+        self._last_id = rows[-1][0] if rows else 0
+        self._last_deleted = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM recipes_deleted").fetchone()[0]
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def load_rows(self):
+        """(row id, recipe) pairs in save order; row ids are stable across processes"""
+        with self._lock:
+            return self._load_rows()
+
+    def load(self):
+        return [recipe for _, recipe in self.load_rows()]
+
+    def iter_recipes(self, batch_size=500):
+        """Recipes in save order, fetched a batch at a time"""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, data FROM recipes WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for _, data in rows:
+                yield json.loads(data)
+            last_id = rows[-1][0]
+
+    def changes(self):
+        """What other processes wrote since we last looked
+
+        None if nothing changed, ('reload', rows) after a full rewrite, otherwise
+        ('delta', new rows, deleted row ids).  New rows may include our own writes.
+        """
+        with self._lock:
+            # data_version only moves when another connection commits, so the common case is one pragma
+            if self._conn.execute("PRAGMA data_version").fetchone()[0] == self._data_version:
+                return None
+            revision, rewritten = self._read_revision()
+            if revision == self.revision:
+                return None
+            if rewritten != self._rewritten:
+                return 'reload', self._load_rows(), []
+            deleted = self._conn.execute(
+                "SELECT seq, recipe_id FROM recipes_deleted WHERE seq > ? ORDER BY seq", (self._last_deleted,)
+            ).fetchall()
+            rows = self._conn.execute(
+                "SELECT id, data FROM recipes WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+            self.revision = revision
+            if deleted:
+                self._last_deleted = deleted[-1][0]
+            if rows:
+                self._last_id = rows[-1][0]
+            return 'delta', [(row[0], json.loads(row[1])) for row in rows], [row[1] for row in deleted]
+
+    def append(self, recipe):
+        """Insert one recipe and return its row id"""
+        with self._lock:
+            row_id = self._insert([recipe])[0]
+            self._bump()
+            self._conn.commit()
+            self.revision += 1
+            return row_id
+
+    def append_many(self, recipes, replaced=()):
+        """Delete the replaced titles and insert the recipes in one transaction; returns the row ids"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM recipes WHERE title = ?", [(title,) for title in replaced])
+            row_ids = self._insert(recipes)
+            self._bump()
+            self._conn.commit()
+            self.revision += 1
+            return row_ids
+
+    def remove(self, title):
+        with self._lock:
+            self._conn.execute("DELETE FROM recipes WHERE title = ?", (title,))
+            self._bump()
+            self._conn.commit()
+            self.revision += 1
+
+    def needs_compaction(self):
+        return False
+
+    def rewrite(self, recipes):
+        """Replace every row and return the new row ids; other processes reload in full"""
+        with self._lock:
+            self._conn.execute("DELETE FROM recipes")
+            last_deleted = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM recipes_deleted").fetchone()[0]
+            self._conn.execute("DELETE FROM recipes_deleted")
+            row_ids = self._insert(recipes)
+            self._bump()
+            self._conn.execute("UPDATE recipes_meta SET rewritten = revision WHERE id = 1")
+            self._conn.commit()
+            self.revision, self._rewritten = self._read_revision()
+            self._last_deleted = last_deleted
+            if row_ids:
+                self._last_id = row_ids[-1]
+            return row_ids
+
+    def sync(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(pantry_file, backend=None):
+    """Pick a pantry store from the file extension or PANTRY_BACKEND"""
+    backend = backend or os.getenv("PANTRY_BACKEND")
+    if backend is None:
+        backend = 'sqlite' if pantry_file.endswith(('.db', '.sqlite')) else 'jsonl'
+    if backend == 'sqlite':
+        return SQLiteStore(pantry_file)
+    return JsonLinesStore(pantry_file)
@@ -0,0 +1,189 @@
+"""Bulk pantry export and import as NDJSON (one saved recipe per line).
+
+Both directions stream: export decompresses one recipe at a time (the CLI reads
+straight from the store, without loading the pantry), and import holds at most
+one batch of rows before writing it to the store in one go.
+
+    python -m app.transfer export > pantry.ndjson
+    python -m app.transfer import pantry.ndjson --batch-size 1000
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from .compress import pack_recipe, unpack_recipe
+from .models import PantryManager
+from .parser import parse_recipe
+from .state import state
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Longer lines are skipped as invalid rather than buffered
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+# How many row errors to report back; the rest are only counted
+IMPORT_MAX_ERRORS = 20
+
+
+def export_lines(recipes):
+    """NDJSON lines for saved recipes, decompressing one at a time"""
+    for recipe in recipes:
+        yield json.dumps(unpack_recipe(recipe), separators=(',', ':'), ensure_ascii=False) + "\n"
+
+
+def validate_row(row):
+    """Saved-recipe record from one imported row; raises ValueError if it can't be saved"""
+    if not isinstance(row, dict):
+        raise ValueError("Expected a JSON object")
+    title = row.get('title')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError("title is required")
+    if not isinstance(row.get('content', ""), str):
+        raise ValueError("content must be a string")
+    if not isinstance(row.get('recipe', {}), dict):
+        raise ValueError("recipe must be an object")
+    recipe = {k: v for k, v in row.items() if k not in ('body', 'terms')}
+    recipe['title'] = title.strip()
+    if not isinstance(recipe.get('saved_date'), str):
+        recipe['saved_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if 'recipe' not in recipe and recipe.get('content'):
+        recipe['recipe'] = parse_recipe(recipe['content'], recipe['title']).to_dict()
+    return pack_recipe(recipe)
+
+
+class PantryImport:
+    def __init__(self, pantry, batch_size=IMPORT_BATCH_SIZE):
+        """Validate, de-duplicate and batch imported rows into the pantry"""
+        self.pantry = pantry
+        self.batch_size = batch_size
+        # title -> record for the current batch; a later row with the same title wins
+        self._pending = {}
+        self.rows = 0
+        self.imported = 0
+        self.replaced = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.batches = 0
+        self.errors = []
+
+    def _reject(self, message):
+        self.invalid += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": self.rows, "error": message})
+
+    def feed_line(self, line):
+        """Add one NDJSON line; None stands for a line that was too long to read"""
+        if line is None:
+            self.rows += 1
+            return self._reject(f"Line longer than {IMPORT_MAX_LINE_BYTES} bytes")
+        if not line.strip():
+            return
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            self.rows += 1
+            return self._reject(f"Invalid JSON: {e.msg}")
+        self.feed(row)
+
+    def feed_lines(self, lines):
+        """Add a chunk of lines; the parsing and compression here is CPU-bound, so servers run it in a thread"""
+        for line in lines:
+            self.feed_line(line)
+
+    def feed(self, row):
+        self.rows += 1
+        try:
+            record = validate_row(row)
+        except ValueError as e:
+            return self._reject(str(e))
+        if self._pending.pop(record['title'], None) is not None:
+            self.duplicates += 1
+        self._pending[record['title']] = record
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending batch to the store"""
+        if not self._pending:
+            return
+        records = list(self._pending.values())
+        self._pending.clear()
+        replaced = self.pantry.add_many(records)
+        self.batches += 1
+        self.imported += len(records) - len(replaced)
+        self.replaced += len(replaced)
+
+    def report(self):
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "replaced": self.replaced,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "batches": self.batches,
+            "errors": self.errors,
+        }
+
+
+async def read_lines(chunks, max_line_bytes=IMPORT_MAX_LINE_BYTES):
+    """Split a stream of byte chunks into lines, yielding None in place of an over-long line"""
+    buffer = bytearray()
+    skipping = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                if not skipping:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        buffer.clear()
+                        skipping = True
+                break
+            if skipping:
+                skipping = False
+                yield None
+            else:
+                buffer += chunk[start:end]
+                yield buffer.decode("utf-8", errors="replace")
+                buffer.clear()
+            start = end + 1
+    if skipping:
+        yield None
+    elif buffer:
+        yield buffer.decode("utf-8", errors="replace")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", nargs="?", default="-", help="NDJSON file, or - for stdout/stdin")
+    parser.add_argument("--pantry", default=os.getenv("PANTRY_FILE", "grandmas_pantry.jsonl"))
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        store = state.pantry_store(args.pantry)
+        try:
+            if args.path == "-":
+                sys.stdout.writelines(export_lines(store.iter_recipes()))
+            else:
+                with open(args.path, "w", encoding="utf-8") as out:
+                    out.writelines(export_lines(store.iter_recipes()))
+        finally:
+            store.close()
+        return
+
+    pantry = PantryManager(args.pantry)
+    try:
+        job = PantryImport(pantry, args.batch_size)
+        with (sys.stdin if args.path == "-" else open(args.path, "r", encoding="utf-8")) as source:
+            for line in source:
+                job.feed_line(line if len(line) <= IMPORT_MAX_LINE_BYTES else None)
+        job.flush()
+        print(json.dumps(job.report(), indent=2), file=sys.stderr)
+    finally:
+        pantry.close()
+
+
+if __name__ == "__main__":
+    main()
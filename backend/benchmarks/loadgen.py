@@ -0,0 +1,205 @@
+"""Offline load generator for the recipe API.
+
+Drives the API at a target request rate and reports latency percentiles and
+throughput. By default the app runs in-process against the fake model provider,
+so no Gemini key or network is needed:
+
+    python benchmarks/loadgen.py --scenario titles --rps 50 --duration 20
+    python benchmarks/loadgen.py --scenario recipe --latency 1.5 --rate-limit-rate 0.05
+    python benchmarks/loadgen.py --scenario mixed --url http://localhost:8000
+    python benchmarks/loadgen.py --scenario all --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+INGREDIENTS = [
+    "salmon", "potatoes", "peas", "chicken", "rice", "garlic", "lemon", "spinach", "tomatoes",
+    "chickpeas", "halloumi", "leeks", "mushrooms", "tofu", "noodles", "carrots", "beef", "thyme",
+]
+PREFERENCES = [None, "not spicy", "French style", "serving only 3 people", "vegetarian"]
+
+
+def ingredient_set(rng, unique_ratio):
+    """A comma separated ingredient list; repeats come from a small hot set"""
+    if rng.random() >= unique_ratio:
+        rng = random.Random(rng.randrange(8))
+    return ", ".join(rng.sample(INGREDIENTS, 3))
+
+
+def titles_request(rng, args, state):
+    body = {"ingredients": ingredient_set(rng, args.unique_ratio), "preferences": rng.choice(PREFERENCES)}
+    return "POST", "/api/generate-titles", body
+
+
+def recipe_request(rng, args, state):
+    ingredients = ingredient_set(rng, args.unique_ratio)
+    title = f"{ingredients.split(',')[0].title()} Plate {rng.randrange(5)}"
+    return "POST", "/api/generate-recipe", {"title": title, "ingredients": ingredients}
+
+
+def pantry_request(rng, args, state):
+    roll = rng.random()
+    if roll < 0.3 or not state["saved"]:
+        title = f"Bench Recipe {state['next']}"
+        state["next"] += 1
+        state["saved"].append(title)
+        ingredients = ingredient_set(rng, 1.0)
+        content = "INGREDIENTS:\n" + "\n".join(f"- 100 g {i}" for i in ingredients.split(", "))
+        return "POST", "/api/save-recipe", {"title": title, "content": content}
+    if roll < 0.6:
+        return "GET", "/api/recipes", None
+    if roll < 0.9:
+        return "GET", f"/api/recipes/search?q={rng.choice(INGREDIENTS)}", None
+    title = state["saved"].pop(rng.randrange(len(state["saved"])))
+    return "POST", "/api/remove-recipe", {"title": title}
+
+
+def mixed_request(rng, args, state):
+    roll = rng.random()
+    if roll < 0.4:
+        return titles_request(rng, args, state)
+    if roll < 0.8:
+        return recipe_request(rng, args, state)
+    return pantry_request(rng, args, state)
+
+
+SCENARIOS = {
+    "titles": titles_request,
+    "recipe": recipe_request,
+    "pantry": pantry_request,
+    "mixed": mixed_request,
+}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def build_client(args):
+    """HTTP client for a live server, or for the app in-process on the fake provider"""
+    import httpx
+
+    if args.url:
+        return httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+
+    # Module-level singletons read these at import time
+    os.environ["MODEL_PROVIDER"] = "fake"
+    os.environ["FAKE_MODEL_LATENCY"] = str(args.latency)
+    os.environ["FAKE_MODEL_JITTER"] = str(args.jitter)
+    os.environ["FAKE_MODEL_ERROR_RATE"] = str(args.error_rate)
+    os.environ["FAKE_MODEL_429_RATE"] = str(args.rate_limit_rate)
+    os.environ["FAKE_MODEL_SEED"] = str(args.seed)
+    os.environ.setdefault("GEMINI_REQUESTS_PER_MINUTE", str(args.quota_rpm))
+    os.environ.setdefault("GEMINI_BURST", str(max(1, args.quota_rpm // 60)))
+    os.environ.setdefault("PANTRY_FILE", os.path.join(tempfile.mkdtemp(), "bench_pantry.jsonl"))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout)
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    make_request = SCENARIOS[args.scenario]
+    state = {"saved": [], "next": 0}
+    latencies = []
+    statuses = {}
+
+    async with build_client(args) as client:
+        async def send(method, path, body):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        # Open loop: requests go out on schedule whether or not earlier ones have finished
+        tasks = []
+        interval = 1.0 / args.rps
+        total = int(args.rps * args.duration)
+        started = time.perf_counter()
+        for i in range(total):
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(*make_request(rng, args, state))))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        "scenario": args.scenario,
+        "target_rps": args.rps,
+        "requests": len(latencies),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "ok": ok,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    }
+
+
+def print_report(result):
+    print(f"scenario     {result['scenario']} @ {result['target_rps']} rps")
+    print(f"requests     {result['requests']} in {result['elapsed']}s ({result['throughput']} req/s)")
+    print(f"statuses     {result['statuses']}")
+    print(f"latency ms   p50={result['p50_ms']} p95={result['p95_ms']} p99={result['p99_ms']} max={result['max_ms']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS) + ["all"], default="mixed")
+    parser.add_argument("--rps", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unique-ratio", type=float, default=0.5,
+                        help="share of generation requests with a fresh ingredient set (rest hit a hot set)")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of fake calls that return 429")
+    parser.add_argument("--quota-rpm", type=int, default=60000,
+                        help="client-side Gemini quota for the in-process app")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = ["titles", "recipe", "pantry"] if args.scenario == "all" else [args.scenario]
+    results = []
+    for scenario in scenarios:
+        args.scenario = scenario
+        result = asyncio.run(run(args))
+        results.append(result)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_report(result)
+            print()
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Lets `pytest` find the `app` package whether it is run from backend/ or from the repo root
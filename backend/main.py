@@ -1,11 +1,10 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import google.generativeai as genai
-import json
-from datetime import datetime
+import asyncio
 import os
-from time import sleep
+from app.admission import ClientMiddleware
+from app.metrics import MetricsMiddleware
+from app.startup import timed
 
 # Initialize FastAPI
 app = FastAPI()
@@ -19,6 +18,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses over 500 bytes: brotli when brotli-asgi is installed and the client accepts it,
+# gzip otherwise. Event streams are left uncompressed so chunks aren't held back.
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=500, gzip_fallback=True, excluded_handlers=[r"/stream$"])
+except ImportError:
+    from fastapi.middleware.gzip import GZipMiddleware
+    app.add_middleware(GZipMiddleware, minimum_size=500)
+
+# Identify the caller (API key or IP) so queued generations are shared fairly
+app.add_middleware(ClientMiddleware)
+
+# Per-endpoint latency histograms, scraped at /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Health check endpoints
 @app.get("/")
 async def root():
@@ -28,156 +42,30 @@ async def root():
 async def api_root():
     return {"message": "Recipe Generator API is running"}
 
-# Configure the API with environment variable
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    raise ValueError("GEMINI_API_KEY environment variable not set")
-genai.configure(api_key=api_key)
-
-class RecipeGenerator:
-    def __init__(self):
-        """Initialize the recipe generator with Gemini"""
-        try:
-            print("Initializing Gemini model...")
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            print("Model initialized successfully!")
-        except Exception as e:
-            print(f"Error in initialization: {str(e)}")
-            self.model = None
-
-    def _handle_rate_limit(self, operation):
-        """Handle rate limiting with retries"""
-        max_retries = 3
-        retry_delay = 60  # seconds
-        
-        for attempt in range(max_retries):
-            try:
-                return operation()
-            except Exception as e:
-                if "RATE_LIMIT_EXCEEDED" in str(e):
-                    if attempt < max_retries - 1:
-                        print(f"Rate limit hit, waiting {retry_delay} seconds...")
-                        sleep(retry_delay)
-                        continue
-                    raise HTTPException(
-                        status_code=429,
-                        detail="Rate limit exceeded. Please try again in a minute."
-                    )
-                raise e
-
-    def generate_titles(self, ingredients, preferences=None):
-        """Generate 5 possible recipe titles using Gemini"""
-        def generate():
-            prompt = f"""
-            Create 5 COMPLETELY DIFFERENT and unique recipe titles using these ingredients: {ingredients}
-            {f'Considering these preferences: {preferences}' if preferences else ''}
-            Rules for titles:
-            - Each must be VERY different from the others
-            - Each must use different cooking methods
-            - Each should have a different cuisine influence
-            - Make them creative and appetizing
-            - Number them 1-5
-            - Each title should be 3-7 words long
-            """
-
-            response = self.model.generate_content(prompt)
-            titles = response.text.strip().split('\n')
-            titles = [t.strip().split('.', 1)[-1].strip() for t in titles if t.strip() and any(c.isdigit() for c in t)]
-            titles = [t.strip('.- 1234567890') for t in titles]
-            titles = list(dict.fromkeys(titles))
-
-            while len(titles) < 5:
-                style = ['Grilled', 'Baked', 'Sautéed', 'Roasted', 'Stir-Fried'][len(titles)]
-                main_ingredient = ingredients.split(',')[0].strip().capitalize()
-                titles.append(f"{style} {main_ingredient} Special")
-
-            return titles[:5]
-
-        try:
-            return self._handle_rate_limit(generate)
-        except Exception as e:
-            print(f"Error generating titles: {e}")
-            return [f"Quick {ingredients.split(',')[0].capitalize()} Dish"] * 5
-
-    def generate_full_recipe(self, title, ingredients, preferences=None):
-        """Generate full recipe for selected title"""
-        def generate():
-            prompt = f"""
-            Create a detailed recipe for: {title}
-            Using these ingredients: {ingredients}
-            {f'Preferences: {preferences}' if preferences else ''}
-            Follow this EXACT format:
-            [TITLE]
-            {title}
-            DESCRIPTION:
-            [Write a brief 2-3 sentence description of the dish]
-            PREPARATION TIME: [X] minutes
-            COOKING TIME: [X] minutes
-            SERVINGS: [X]
-            INGREDIENTS:
-            - [List each ingredient with exact measurements]
-            INSTRUCTIONS:
-            1. [First step]
-            2. [Second step]
-            [Continue with all steps]
-            TIPS:
-            - [Add 2-3 cooking tips specific to this recipe]
-            """
-
-            response = self.model.generate_content(prompt)
-            return {"title": title, "content": response.text}
-
-        try:
-            return self._handle_rate_limit(generate)
-        except Exception as e:
-            return {"title": "Error", "content": str(e)}
-
-# Initialize recipe generator
-recipe_generator = RecipeGenerator()
-
-# For Vercel, we'll keep recipes in memory (this will reset on deploy)
-saved_recipes = []
-
-# API Routes
-@app.post("/api/generate-titles")
-async def generate_titles(request: Request):
-    data = await request.json()
-    titles = recipe_generator.generate_titles(data['ingredients'], data.get('preferences'))
-    return JSONResponse({"titles": titles})
-
-@app.post("/api/generate-recipe")
-async def generate_recipe(request: Request):
-    data = await request.json()
-    recipe = recipe_generator.generate_full_recipe(
-        data['title'], 
-        data['ingredients'], 
-        data.get('preferences')
-    )
-    return JSONResponse(recipe)
-
-@app.post("/api/save-recipe")
-async def save_recipe(request: Request):
-    data = await request.json()
-    data['saved_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    saved_recipes.append(data)
-    return JSONResponse({"recipes": [recipe['title'] for recipe in saved_recipes]})
-
-@app.post("/api/remove-recipe")
-async def remove_recipe(request: Request):
-    try:
-        data = await request.json()
-        print("Received data:", data)
-        recipe_title = data.get('title')
-        if not recipe_title:
-            return JSONResponse({"error": "Title is required"}, status_code=400)
-        
-        global saved_recipes
-        saved_recipes = [r for r in saved_recipes if r['title'] != recipe_title]
-        return JSONResponse({"recipes": [recipe['title'] for recipe in saved_recipes]})
-    except Exception as e:
-        print("Error removing recipe:", e)
-        return JSONResponse({"error": str(e)}, status_code=500)
-
-@app.get("/api/recipes")
-async def get_recipes():
-    return JSONResponse({"recipes": [recipe['title'] for recipe in saved_recipes]})
+# API Routes (generation runs through the async engine in app.models).
+# The Gemini SDK is imported and configured on the first generation request.
+with timed("app.routes"):
+    from app.routes import router, pantry_manager, prefetcher, recipe_generator
+    from app.state import state
+app.include_router(router)
+
+if os.getenv('MODEL_PROVIDER', 'gemini') != 'fake' and not os.getenv('GEMINI_API_KEY'):
+    print("Warning: GEMINI_API_KEY environment variable not set, generation will fail")
+
+@app.on_event("startup")
+async def startup():
+    # Optionally load the model in the background so the first request doesn't pay for it
+    if os.getenv('WARM_UP_ON_STARTUP', 'false').lower() == 'true':
+        asyncio.create_task(recipe_generator.warm_up())
+
+@app.on_event("shutdown")
+async def shutdown():
+    prefetcher.cancel_all()
+    recipe_generator.engine.shutdown()
+    pantry_manager.close()
+    state.close()
+
+if __name__ == "__main__":
+    import uvicorn
+    print("Starting Recipe Generator...")
+    uvicorn.run(app, host="0.0.0.0", port=8000)
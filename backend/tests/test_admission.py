@@ -0,0 +1,209 @@
+import asyncio
+import pytest
+from app.admission import (
+    BATCH, INTERACTIVE, PREFETCH, AdmissionController, ClientMiddleware, Overloaded, current_client, request_priority,
+)
+from app.cache import LRUCache, ResponseCache, make_key
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_free_slots_go_to_the_most_urgent_class_first():
+    async def main():
+        admission = AdmissionController(max_concurrency=1)
+        order = []
+
+        async def job(priority, name):
+            async with admission.slot(priority, name):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        async with admission.slot(INTERACTIVE, "holder"):
+            tasks = [asyncio.create_task(job(p, n)) for p, n in
+                     [(PREFETCH, "prefetch"), (BATCH, "batch"), (INTERACTIVE, "interactive")]]
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(main()) == ["interactive", "batch", "prefetch"]
+
+
+def test_clients_take_turns_within_a_class():
+    async def main():
+        admission = AdmissionController(max_concurrency=1)
+        order = []
+
+        async def job(client, n):
+            async with admission.slot(BATCH, client):
+                order.append(f"{client}{n}")
+
+        async with admission.slot(INTERACTIVE, "holder"):
+            tasks = [asyncio.create_task(job("a", n)) for n in range(3)]
+            tasks.append(asyncio.create_task(job("b", 0)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(main()) == ["a0", "b0", "a1", "a2"]
+
+
+def test_prefetch_is_shed_when_the_wait_would_pass_its_deadline():
+    async def main():
+        admission = AdmissionController(max_concurrency=1, deadlines={PREFETCH: 1})
+        async with admission.slot(INTERACTIVE, "holder"):
+            with pytest.raises(Overloaded) as shed:
+                async with admission.slot(PREFETCH, "someone"):
+                    pass
+        return shed.value, admission.shed
+
+    error, shed = run(main())
+    assert error.status_code == 503 and int(error.headers["Retry-After"]) >= 1
+    assert shed == {"deadline": 1}
+
+
+def test_a_full_queue_evicts_less_urgent_waiters():
+    async def main():
+        admission = AdmissionController(max_concurrency=1, max_queue=1)
+        async with admission.slot(INTERACTIVE, "holder"):
+            prefetch = asyncio.create_task(admission.slot(PREFETCH, "p").__aenter__())
+            await asyncio.sleep(0)
+            interactive = asyncio.create_task(admission.slot(INTERACTIVE, "i").__aenter__())
+            await asyncio.sleep(0)
+            with pytest.raises(Overloaded):
+                await prefetch
+        await interactive
+        return admission.shed
+
+    assert run(main()) == {"evicted": 1}
+
+
+@pytest.mark.parametrize("headers, trust, client", [
+    ([], False, "10.0.0.1"),
+    ([(b"x-api-key", b"team")], False, "key:team"),
+    ([(b"x-api-key", b"made-up")], False, "10.0.0.1"),
+    ([(b"x-forwarded-for", b"1.2.3.4")], False, "10.0.0.1"),
+    ([(b"x-forwarded-for", b"1.2.3.4, 5.6.7.8")], True, "5.6.7.8"),
+])
+def test_client_middleware_names_the_fairness_bucket(headers, trust, client):
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(current_client.get())
+
+    middleware = ClientMiddleware(app, trust_forwarded_for=trust, api_keys={"team"})
+    run(middleware({"type": "http", "headers": headers, "client": ("10.0.0.1", 5000)}, None, None))
+    assert seen == [client]
+
+
+def test_make_key_ignores_ingredient_order_case_and_spacing():
+    assert make_key("titles", "Garlic, leek ,garlic", "  Quick ") == make_key("titles", "leek,garlic", "quick")
+    assert make_key("titles", "garlic") != make_key("recipe", "garlic")
+
+
+def test_concurrent_misses_share_one_computation():
+    async def main():
+        cache = ResponseCache(LRUCache())
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"titles": ["Soup"]}
+
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+        again = await cache.get_or_compute("k", compute)
+        return results, again, calls, cache.stats()
+
+    results, again, calls, stats = run(main())
+    assert results == [{"titles": ["Soup"]}] * 5 and again == {"titles": ["Soup"]}
+    assert len(calls) == 1
+    assert stats["coalesced"] == 4 and stats["hits"] == 1
+
+
+def test_waiters_recompute_when_the_owner_is_cancelled():
+    async def main():
+        cache = ResponseCache(LRUCache())
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        async def fast():
+            return "value"
+
+        owner = asyncio.create_task(cache.get_or_compute("k", slow))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_compute("k", fast))
+        await asyncio.sleep(0)
+        owner.cancel()
+        return await waiter
+
+    assert run(main()) == "value"
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    async def main():
+        cache = ResponseCache(LRUCache())
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("model down")
+
+        results = await asyncio.gather(*(cache.get_or_compute("k", fail) for _ in range(3)), return_exceptions=True)
+        return results, cache.get("k")
+
+    results, cached = run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cached is None
+
+
+def test_a_shed_prefetch_owner_does_not_fail_interactive_waiters():
+    async def main():
+        cache = ResponseCache(LRUCache())
+        admission = AdmissionController(max_concurrency=1, deadlines={PREFETCH: 0.05})
+        # Short enough that the prefetch queues and then times out, rather than being turned away up front
+        admission.service_time = 0.01
+        calls = []
+
+        async def compute():
+            calls.append(request_priority.get())
+            async with admission.slot():
+                return "recipe"
+
+        async def prefetch():
+            request_priority.set(PREFETCH)
+            return await cache.get_or_compute("k", compute)
+
+        async with admission.slot(INTERACTIVE, "holder"):
+            owner = asyncio.create_task(prefetch())
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(cache.get_or_compute("k", compute))
+            await asyncio.sleep(0.1)
+        results = await asyncio.gather(owner, waiter, return_exceptions=True)
+        return results, calls
+
+    (owner, waiter), calls = run(main())
+    assert isinstance(owner, Overloaded)
+    assert waiter == "recipe"
+    assert calls == [PREFETCH, INTERACTIVE]
+
+
+def test_waiters_no_more_urgent_than_a_shed_owner_share_its_503():
+    async def main():
+        cache = ResponseCache(LRUCache())
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise Overloaded(1)
+
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(3)),
+                                    return_exceptions=True), calls
+
+    results, calls = run(main())
+    assert all(isinstance(r, Overloaded) for r in results)
+    assert len(calls) == 1
@@ -0,0 +1,67 @@
+import pytest
+from app.parser import parse_ingredient, parse_minutes, parse_recipe, parse_titles, split_sections
+
+RECIPE = """[TITLE]
+Garlic Soup
+DESCRIPTION:
+A warming soup.
+Cooking time may vary with the pot.
+PREPARATION TIME: 10 minutes
+COOKING TIME: 1 hour 15 minutes
+SERVINGS: 4
+INGREDIENTS:
+- 1 1/2 cups of stock
+- ½ tsp salt
+For the topping:
+- 2 slices bread
+- a handful of parsley
+INSTRUCTIONS:
+1. Simmer the stock.
+2. Add the garlic.
+TIPS:
+- Freeze leftovers.
+"""
+
+
+def test_parse_recipe_fills_every_field():
+    recipe = parse_recipe(RECIPE)
+    assert recipe.title == "Garlic Soup"
+    assert recipe.description == "A warming soup. Cooking time may vary with the pot."
+    assert (recipe.prep_minutes, recipe.cook_minutes, recipe.servings) == (10, 75, 4)
+    assert [(i.quantity, i.unit, i.name, i.group) for i in recipe.ingredients] == [
+        (1.5, 'cup', 'stock', None),
+        (0.5, 'tsp', 'salt', None),
+        (2.0, 'slice', 'bread', 'For the topping'),
+        (None, None, 'a handful of parsley', 'For the topping'),
+    ]
+    assert recipe.steps == ["Simmer the stock.", "Add the garlic."]
+    assert recipe.tips == ["Freeze leftovers."]
+
+
+def test_split_sections_keeps_every_line():
+    blocks = split_sections(RECIPE)
+    assert [section for section, _ in blocks] == [
+        'title', 'description', 'prep', 'cook', 'servings', 'ingredients', 'instructions', 'tips']
+    assert "\n".join(line for _, lines in blocks for line in lines) == RECIPE.rstrip("\n")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("3/4 cup sugar", (0.75, 'cup', 'sugar')),
+    ("2.5 kg potatoes", (2.5, 'kg', 'potatoes')),
+    ("1½ tbsp. oil", (1.5, 'tbsp', 'oil')),
+    ("3 eggs", (3.0, None, 'eggs')),
+    ("1/0 cup flour", (None, None, '1/0 cup flour')),
+])
+def test_parse_ingredient(text, expected):
+    ingredient = parse_ingredient(text)
+    assert (ingredient.quantity, ingredient.unit, ingredient.name) == expected
+
+
+@pytest.mark.parametrize("text, minutes", [("45", 45), ("1.5 hours", 90), ("20 mins", 20), ("n/a", None)])
+def test_parse_minutes(text, minutes):
+    assert parse_minutes(text) == minutes
+
+
+def test_parse_titles_drops_duplicates_and_markup():
+    text = "Here you go:\n1. **Garlic Soup**\n2) Leek Tart\n3. garlic soup\n- not numbered"
+    assert parse_titles(text) == ["Garlic Soup", "Leek Tart"]
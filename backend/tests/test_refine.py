@@ -0,0 +1,54 @@
+import pytest
+from app.refine import plan_change, scale_line, scale_servings
+
+
+@pytest.mark.parametrize("change, servings", [
+    ("make it serve 8", 8),
+    ("serves 3", 3),
+    ("feeds 6", 6),
+    ("for 6 people", 6),
+    ("scale to 4 servings", 4),
+    ("serving only 3 people", 3),
+])
+def test_servings_only_changes_stay_local(change, servings):
+    assert plan_change(change) == (servings, [], "")
+
+
+@pytest.mark.parametrize("change", [
+    "bake for 20 minutes",
+    "preheat the oven to 220 instead",
+    "reduce the sugar to 50 grams",
+    "cook for 1 hour",
+    "add 2 eggs",
+])
+def test_times_temperatures_and_amounts_are_not_servings(change):
+    servings, sections, remainder = plan_change(change)
+    assert servings is None
+    assert remainder == change
+    assert sections
+
+
+def test_servings_and_other_change_are_split():
+    servings, sections, remainder = plan_change("no garlic, for 2 people")
+    assert servings == 2
+    assert remainder == "no garlic"
+    assert sections == ["ingredients", "instructions"]
+
+
+def test_scale_servings_rewrites_quantities():
+    text = "SERVINGS: 4\nINGREDIENTS:\n- 200 g rice\n- 1 1/2 cups stock\n- 2-3 cloves garlic\n- Salt to taste"
+    assert scale_servings(text, 2) == (
+        "SERVINGS: 2\nINGREDIENTS:\n- 100 g rice\n- 3/4 cups stock\n- 1-1 1/2 cloves garlic\n- Salt to taste"
+    )
+
+
+@pytest.mark.parametrize("change, servings", [("serves 0", None), ("no garlic", 0), ("", -2)])
+def test_servings_below_one_are_rejected(change, servings):
+    with pytest.raises(ValueError):
+        plan_change(change, servings)
+
+
+def test_scale_line_uses_the_unit_for_rounding():
+    assert scale_line("- 1.5 kg flour", 0.5) == "- 0.75 kg flour"
+    assert scale_line("* 250 grams sugar", 1 / 3) == "* 83 grams sugar"
+    assert scale_line("1. 3 eggs", 0.5) == "1. 1 1/2 eggs"
@@ -0,0 +1,30 @@
+from app.semantic import SemanticCache, ingredient_set
+
+
+def test_near_duplicate_spellings_share_a_result():
+    cache = SemanticCache(max_entries=8)
+    cache.set("titles", "courgettes, spring onions, chicken thighs, rice", None, ["Stir-fry"])
+    assert cache.get("titles", "zucchini, scallion, chicken, rice") == ["Stir-fry"]
+
+
+def test_a_result_is_not_reused_when_it_leaves_out_an_asked_for_ingredient():
+    cache = SemanticCache(max_entries=8)
+    cache.set("titles", "chicken, rice, garlic, onion, pepper, tomato, basil", None, ["Pilaf"])
+    assert cache.get("titles", "chicken, rice, garlic, onion, pepper, tomato, basil, peanuts") is None
+    assert cache.get("titles", "chicken, rice, garlic, onion, pepper, tomato") == ["Pilaf"]
+
+
+def test_pasta_shapes_and_numbered_ingredients_stay_distinct():
+    assert ingredient_set("spaghetti, penne") == {"spaghetti", "penne"}
+    assert ingredient_set("00 flour") == {"00 flour"}
+    cache = SemanticCache(max_entries=8)
+    cache.set("titles", "spaghetti, garlic, oil", None, ["Aglio e olio"])
+    assert cache.get("titles", "penne, garlic, oil") is None
+
+
+def test_groups_and_empty_sets_never_match():
+    cache = SemanticCache(max_entries=8)
+    cache.set("titles", "garlic, leek", "vegan", ["Leek soup"])
+    assert cache.get("titles", "garlic, leek") is None
+    assert cache.get("recipe", "garlic, leek", "vegan", "Leek soup") is None
+    assert cache.get("titles", "fresh, chopped", "vegan") is None
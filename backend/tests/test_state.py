@@ -0,0 +1,27 @@
+import sqlite3
+from app.state import SQLiteState
+
+
+def test_a_locked_state_file_falls_back_to_local_state(tmp_path):
+    path = str(tmp_path / "state.db")
+    state = SQLiteState(path, busy_timeout_ms=10)
+    state.set("cache", "a", 1)
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    assert state.take("quota", 1.0, 5) == (0.0, True)
+    assert state.add("lease", "a", 1, 30)
+    state.set("cache", "b", 2)
+    assert state.get("cache", "a") == 1 and state.get("cache", "b") == 2
+    assert state.fallbacks == 3
+    blocker.execute("ROLLBACK")
+    assert state.add("lease", "a", 1, 30)
+    assert state.fallbacks == 3
+    state.close()
+
+
+def test_the_pantry_gets_its_own_file(tmp_path):
+    state = SQLiteState(str(tmp_path / "state.db"))
+    store = state.pantry_store(str(tmp_path / "grandmas_pantry.jsonl"))
+    assert store.path == str(tmp_path / "grandmas_pantry.db")
+    assert state.pantry_store(str(tmp_path / "recipes.db")).path == str(tmp_path / "recipes.db")
+    state.close()
@@ -0,0 +1,110 @@
+import json
+import pytest
+from app.models import PantryManager
+from app.storage import JsonLinesStore, SQLiteStore
+from app.transfer import export_lines
+
+
+def recipe(title, ingredient="garlic"):
+    return {"title": title, "content": "", "recipe": {"ingredients": [{"name": ingredient}]}}
+
+
+def test_torn_final_line_is_dropped_and_appends_start_clean(tmp_path):
+    path = tmp_path / "pantry.jsonl"
+    store = JsonLinesStore(str(path))
+    store.append(recipe("Soup"))
+    store.close()
+    with open(path, "a") as f:
+        f.write('{"op":"put","recipe":{"title":"Ha')
+
+    store = JsonLinesStore(str(path))
+    assert [r["title"] for r in store.load()] == ["Soup"]
+    store.append(recipe("Stew"))
+    store.close()
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["recipe"]["title"] for line in lines] == ["Soup", "Stew"]
+
+
+def test_deletes_replay_and_later_puts_win(tmp_path):
+    store = JsonLinesStore(str(tmp_path / "pantry.jsonl"))
+    store.append(recipe("Soup", "leek"))
+    store.append(recipe("Stew"))
+    store.remove("Soup")
+    store.append(recipe("Soup", "onion"))
+    store.close()
+    loaded = JsonLinesStore(str(tmp_path / "pantry.jsonl")).load()
+    assert [(r["title"], r["recipe"]["ingredients"][0]["name"]) for r in loaded] == [("Stew", "garlic"), ("Soup", "onion")]
+
+
+def test_pantry_compacts_the_log_past_the_slack(tmp_path):
+    path = tmp_path / "pantry.jsonl"
+    store = JsonLinesStore(str(path), compact_slack=3)
+    pantry = PantryManager(str(path), store=store, legacy_file=None)
+    for _ in range(3):
+        # Each re-save of a title logs a delete and a put
+        pantry.add_recipe(recipe("Soup"))
+    assert len(path.read_text().splitlines()) == 1
+    pantry.add_recipe(recipe("Stew"))
+    pantry.add_recipe(recipe("Soup"))
+    pantry.close()
+    reopened = PantryManager(str(path), store=JsonLinesStore(str(path)), legacy_file=None)
+    assert reopened.get_recipe_list() == ["Stew", "Soup"]
+
+
+def test_sqlite_store_hands_other_connections_a_delta(tmp_path):
+    path = str(tmp_path / "pantry.db")
+    writer, reader = SQLiteStore(path), SQLiteStore(path)
+    writer.load_rows()
+    reader.load_rows()
+    ids = writer.append_many([recipe("Soup"), recipe("Stew")])
+    assert reader.changes() == ('delta', [(ids[0], recipe("Soup")), (ids[1], recipe("Stew"))], [])
+    assert reader.changes() is None
+    writer.remove("Soup")
+    assert reader.changes() == ('delta', [], [ids[0]])
+    writer.close()
+    reader.close()
+
+
+def test_sqlite_rewrite_makes_other_connections_reload(tmp_path):
+    path = str(tmp_path / "pantry.db")
+    writer, reader = SQLiteStore(path), SQLiteStore(path)
+    writer.load_rows()
+    writer.append(recipe("Soup"))
+    reader.load_rows()
+    ids = writer.rewrite([recipe("Stew")])
+    kind, rows, _ = reader.changes()
+    assert kind == 'reload'
+    assert rows == [(ids[0], recipe("Stew"))]
+    assert reader.revision == writer.revision
+    writer.close()
+    reader.close()
+
+
+def test_pantries_sharing_a_sqlite_store_agree_on_etag_and_order(tmp_path):
+    path = str(tmp_path / "pantry.db")
+    first = PantryManager(path, store=SQLiteStore(path), legacy_file=None)
+    second = PantryManager(path, store=SQLiteStore(path), legacy_file=None)
+    first.add_recipe(recipe("Soup"))
+    second.add_recipe(recipe("Stew"))
+    first.remove_recipe("Soup")
+    assert first.etag == second.etag
+    assert first.list_page() == second.list_page()
+    assert second.search("garlic") == ["Stew"]
+    first.close()
+    second.close()
+
+
+@pytest.mark.parametrize("name, open_store", [("pantry.jsonl", JsonLinesStore), ("pantry.db", SQLiteStore)])
+def test_stores_stream_the_same_recipes_the_pantry_holds(tmp_path, name, open_store):
+    path = str(tmp_path / name)
+    pantry = PantryManager(path, store=open_store(path), legacy_file=None)
+    for title in ["Soup", "Stew", "Pie"]:
+        pantry.add_recipe(recipe(title))
+    pantry.add_recipe(recipe("Soup", "onion"))
+    pantry.remove_recipe("Stew")
+    expected = list(export_lines(pantry.iter_recipes()))
+    pantry.close()
+    store = open_store(path)
+    assert list(export_lines(store.iter_recipes())) == expected
+    assert [json.loads(line)["title"] for line in expected] == ["Pie", "Soup"]
+    store.close()
@@ -1,11 +1,21 @@
+from time import monotonic, perf_counter, sleep
+_import_started = perf_counter()
+
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import google.generativeai as genai
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import json
+import math
+import random
+import re
+import threading
 from datetime import datetime
 import os
-from time import sleep
+
+# Cold-start report (seconds); the Gemini SDK is imported lazily on first generation
+STARTUP_REPORT = {"fastapi": round(perf_counter() - _import_started, 4)}
 
 # Initialize FastAPI
 app = FastAPI()
@@ -38,42 +48,105 @@ async def add_cors_header(request, call_next):
 async def root():
     return {"message": "Recipe Generator API is running"}
 
-# Configure the API
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    raise ValueError("GEMINI_API_KEY environment variable not set")
-genai.configure(api_key=api_key)
+def rate_limit_exceeded(retry_after):
+    """429 response telling the client when to come back"""
+    retry_after = max(1, math.ceil(retry_after))
+    return HTTPException(
+        status_code=429,
+        detail=f"Rate limit exceeded. Please try again in {retry_after} seconds.",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def is_rate_limit_error(error):
+    """Check whether a Gemini error is a 429 / quota error"""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    # Gemini names the quota reason explicitly; a bare "429" substring matches unrelated errors
+    return "RATE_LIMIT_EXCEEDED" in str(error)
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """Token bucket refilled at `rate` tokens per second"""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, deadline=None):
+        """Take a token and return how long to wait before using it; 429 if that is past the deadline"""
+        with self._lock:
+            self._refill(monotonic())
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if deadline is not None and wait > deadline:
+                raise rate_limit_exceeded(wait)
+            self.tokens -= 1
+            return wait
+
+    def expected_wait(self):
+        """Seconds until the next token is free"""
+        with self._lock:
+            self._refill(monotonic())
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+# Client-side Gemini quota for this instance; each serverless instance gets its own bucket
+gemini_bucket = TokenBucket(
+    float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '15')) / 60.0,
+    int(os.getenv('GEMINI_BURST', '5')),
+)
 
 class RecipeGenerator:
     def __init__(self):
-        """Initialize the recipe generator with Gemini"""
-        try:
-            print("Initializing Gemini model...")
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            print("Model initialized successfully!")
-        except Exception as e:
-            print(f"Error in initialization: {str(e)}")
-            self.model = None
+        """Set up the recipe generator; the Gemini SDK and model load on first use"""
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Import and configure Gemini the first time a generation needs it"""
+        with self._model_lock:
+            if self._model is None:
+                api_key = os.getenv('GEMINI_API_KEY')
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY environment variable not set")
+                print("Initializing Gemini model...")
+                started = perf_counter()
+                import google.generativeai as genai
+                STARTUP_REPORT["google.generativeai"] = round(perf_counter() - started, 4)
+                started = perf_counter()
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel('gemini-1.5-flash')
+                STARTUP_REPORT["model_init"] = round(perf_counter() - started, 4)
+                print("Model initialized successfully!")
+            return self._model
 
     def _handle_rate_limit(self, operation):
-        """Handle rate limiting with retries"""
-        max_retries = 3
-        retry_delay = 60  # seconds
-        
+        """Smooth calls through the token bucket and retry 429s with jittered backoff, failing fast past the deadline"""
+        max_retries = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '3'))
+        deadline = float(os.getenv('RATE_LIMIT_DEADLINE', '10'))  # seconds
+        started = monotonic()
+
         for attempt in range(max_retries):
+            wait = gemini_bucket.reserve(deadline - (monotonic() - started))
+            if wait:
+                sleep(wait)
             try:
                 return operation()
             except Exception as e:
-                if "RATE_LIMIT_EXCEEDED" in str(e):
-                    if attempt < max_retries - 1:
-                        print(f"Rate limit hit, waiting {retry_delay} seconds...")
-                        sleep(retry_delay)
-                        continue
-                    raise HTTPException(
-                        status_code=429,
-                        detail="Rate limit exceeded. Please try again in a minute."
-                    )
-                raise e
+                if not is_rate_limit_error(e):
+                    raise
+                retry_delay = random.uniform(0, 2 ** attempt)
+                if attempt < max_retries - 1 and monotonic() - started + retry_delay <= deadline:
+                    print(f"Rate limit hit, waiting {retry_delay:.1f} seconds...")
+                    sleep(retry_delay)
+                    continue
+                raise rate_limit_exceeded(max(retry_delay, gemini_bucket.expected_wait()))
 
     def generate_titles(self, ingredients, preferences=None):
         """Generate 5 possible recipe titles using Gemini"""
@@ -105,6 +178,8 @@ class RecipeGenerator:
 
         try:
             return self._handle_rate_limit(generate)
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error generating titles: {e}")
             return [f"Quick {ingredients.split(',')[0].capitalize()} Dish"] * 5
@@ -139,20 +214,58 @@ class RecipeGenerator:
 
         try:
             return self._handle_rate_limit(generate)
+        except HTTPException:
+            raise
         except Exception as e:
             return {"title": "Error", "content": str(e)}
 
 # Initialize recipe generator
 recipe_generator = RecipeGenerator()
 
-# For Vercel, we'll keep recipes in memory (this will reset on deploy)
-saved_recipes = []
+# Generation runs in the threadpool so a slow Gemini call doesn't stall the event loop
+generation_slots = asyncio.Semaphore(int(os.getenv('MAX_CONCURRENT_GENERATIONS', '32')))
+
+@app.post("/api/warmup")
+async def warm_up():
+    try:
+        await run_in_threadpool(lambda: recipe_generator.model)
+        return JSONResponse({"ready": True})
+    except Exception as e:
+        print(f"Error in initialization: {str(e)}")
+        return JSONResponse({"ready": False, "error": str(e)}, status_code=503)
+
+@app.get("/api/startup")
+async def startup_report():
+    return JSONResponse({"timings": STARTUP_REPORT, "uptime": round(perf_counter() - _import_started, 3)})
+
+# For Vercel, we'll keep recipes in memory (this will reset on deploy, and each instance has its own copy).
+# Serverless instances share no disk, so shared saves need an external store; backend/ supports
+# STATE_BACKEND=sqlite for several workers on one host.
+# Keyed by title for O(1) get/remove, plus an inverted index of title/ingredient words
+saved_recipes = {}
+recipe_index = {}
+
+def recipe_terms(recipe):
+    """Words from the title and the INGREDIENTS section of a recipe"""
+    content = recipe.get('content') or ''
+    section = re.search(r'INGREDIENTS:?(.*?)(?:INSTRUCTIONS|$)', content, re.IGNORECASE | re.DOTALL)
+    text = recipe.get('title', '') + ' ' + (section.group(1) if section else '')
+    return {w[:-1] if len(w) > 3 and w.endswith('s') else w for w in re.findall(r'[a-z]+', text.lower())}
+
+def index_recipe(recipe):
+    for term in recipe_terms(recipe):
+        recipe_index.setdefault(term, set()).add(recipe['title'])
+
+def unindex_recipe(recipe):
+    for term in recipe_terms(recipe):
+        recipe_index.get(term, set()).discard(recipe['title'])
 
 # API Routes with explicit CORS headers
 @app.post("/api/generate-titles")
 async def generate_titles(request: Request):
     data = await request.json()
-    titles = recipe_generator.generate_titles(data['ingredients'], data.get('preferences'))
+    async with generation_slots:
+        titles = await run_in_threadpool(recipe_generator.generate_titles, data['ingredients'], data.get('preferences'))
     response = JSONResponse({"titles": titles})
     response.headers['Access-Control-Allow-Origin'] = 'https://dblakemorris.github.io'
     return response
@@ -160,11 +273,13 @@ async def generate_titles(request: Request):
 @app.post("/api/generate-recipe")
 async def generate_recipe(request: Request):
     data = await request.json()
-    recipe = recipe_generator.generate_full_recipe(
-        data['title'], 
-        data['ingredients'], 
-        data.get('preferences')
-    )
+    async with generation_slots:
+        recipe = await run_in_threadpool(
+            recipe_generator.generate_full_recipe,
+            data['title'],
+            data['ingredients'],
+            data.get('preferences')
+        )
     response = JSONResponse(recipe)
     response.headers['Access-Control-Allow-Origin'] = 'https://dblakemorris.github.io'
     return response
@@ -173,8 +288,11 @@ async def generate_recipe(request: Request):
 async def save_recipe(request: Request):
     data = await request.json()
     data['saved_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    saved_recipes.append(data)
-    response = JSONResponse({"recipes": [recipe['title'] for recipe in saved_recipes]})
+    if data['title'] in saved_recipes:
+        unindex_recipe(saved_recipes[data['title']])
+    saved_recipes[data['title']] = data
+    index_recipe(data)
+    response = JSONResponse({"recipes": list(saved_recipes)})
     response.headers['Access-Control-Allow-Origin'] = 'https://dblakemorris.github.io'
     return response
 
@@ -187,9 +305,10 @@ async def remove_recipe(request: Request):
         if not recipe_title:
             return JSONResponse({"error": "Title is required"}, status_code=400)
         
-        global saved_recipes
-        saved_recipes = [r for r in saved_recipes if r['title'] != recipe_title]
-        response = JSONResponse({"recipes": [recipe['title'] for recipe in saved_recipes]})
+        removed = saved_recipes.pop(recipe_title, None)
+        if removed is not None:
+            unindex_recipe(removed)
+        response = JSONResponse({"recipes": list(saved_recipes)})
         response.headers['Access-Control-Allow-Origin'] = 'https://dblakemorris.github.io'
         return response
     except Exception as e:
@@ -200,10 +319,20 @@ async def remove_recipe(request: Request):
 
 @app.get("/api/recipes")
 async def get_recipes():
-    response = JSONResponse({"recipes": [recipe['title'] for recipe in saved_recipes]})
+    response = JSONResponse({"recipes": list(saved_recipes)})
     response.headers['Access-Control-Allow-Origin'] = 'https://dblakemorris.github.io'
     return response
 
+@app.get("/api/recipes/search")
+async def search_recipes(q: str = ""):
+    terms = recipe_terms({'title': q})
+    matches = set.intersection(*(recipe_index.get(t, set()) for t in terms)) if terms else set()
+    response = JSONResponse({"query": q, "recipes": sorted(matches)})
+    response.headers['Access-Control-Allow-Origin'] = 'https://dblakemorris.github.io'
+    return response
+
+STARTUP_REPORT["module"] = round(perf_counter() - _import_started, 4)
+
 if __name__ == "__main__":
     import uvicorn
     print("Starting Recipe Generator...")